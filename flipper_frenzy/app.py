@@ -1,168 +1,590 @@
 
+import cProfile
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import csv
+import datetime
+import io
 import json
+import os
+import pstats
+import threading
+import time
 
-from flask import Flask, request, session, render_template, redirect, url_for
+from flask import (
+    Flask, request, session, render_template, redirect, url_for, jsonify, g,
+    abort,
+)
 
+import flipper_frenzy.cache
 import flipper_frenzy.main
+import flipper_frenzy.metrics
+import flipper_frenzy.projection
+import flipper_frenzy.registry
+import flipper_frenzy.store
 
 app = Flask(__name__)
 app.secret_key = "give the golden goose a gander"
 
-
-@app.route("/")
+# the session cookie only holds the tournament id, the data lives here
+store = flipper_frenzy.store.open_store(
+    os.environ.get("FLIPPER_FRENZY_STORE", "memory")
+)
+
+# when running several processes, each one is a shard that serves the
+# tournaments hashed to it. list every shard's base url in the same order
+# everywhere, and tell each process which one it is
+SHARD_URLS = [
+    url.rstrip("/")
+    for url in os.environ.get("FLIPPER_FRENZY_SHARD_URLS", "").split(",") if url
+]
+SHARD = int(os.environ.get("FLIPPER_FRENZY_SHARD", "0"))
+registry = flipper_frenzy.registry.TournamentRegistry(
+    store, shard=SHARD, num_shards=max(len(SHARD_URLS), 1)
+)
+
+# seconds between keep-alive comments on idle event streams
+EVENTS_KEEPALIVE = 15
+
+# rows read per lock of the tournament while streaming an export
+EXPORT_CHUNK = 500
+EXPORT_MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+STANDINGS_FIELDS = (
+    "rank", "name", "num_wins", "num_losses", "num_played", "ratio", "enabled",
+)
+MATCH_FIELDS = (
+    "id", "player_a", "player_b", "machine_name", "winner", "completed_at",
+)
+
+# most matches /api/history returns at once
+MAX_HISTORY_PAGE = 500
+
+# rendered pages and parts of pages, see cached_render
+render_cache = flipper_frenzy.cache.RenderCache()
+
+# recently profiled requests for each tournament, shown on the debug page
+MAX_PROFILES = 10
+profiles = {}
+# only one request can be profiled at a time
+profile_lock = threading.Lock()
+
+
+def tournament_route(rule, **options):
+    """Route a view for the session's tournament and under /t/<tournament_id>."""
+    def decorator(view):
+        app.add_url_rule(rule, view_func=view, **options)
+        app.add_url_rule("/t/<tournament_id>" + rule, view_func=view, **options)
+        return view
+    return decorator
+
+
+@app.url_value_preprocessor
+def pop_tournament_id(endpoint, values):
+    g.tournament_id = values.pop("tournament_id", None) if values else None
+
+
+@app.url_defaults
+def add_tournament_id(endpoint, values):
+    # keep links on a tournament's page pointing at that same tournament
+    tournament_id = g.get("tournament_id")
+    if (tournament_id is not None and "tournament_id" not in values
+            and app.url_map.is_endpoint_expecting(endpoint, "tournament_id")):
+        values["tournament_id"] = tournament_id
+
+
+def get_tournament_id(create=True):
+    """Return the tournament in the url, or else the session's own one."""
+    tournament_id = g.get("tournament_id")
+    if tournament_id is None:
+        tournament_id = session.get("tournament_id")
+        if tournament_id is None and create:
+            tournament_id = session["tournament_id"] = registry.new_id()
+    return tournament_id
+
+
+def use_tournament(create=True):
+    """Check out the live tournament for the current request.
+
+    Views that only read it pass create=False, so a visitor who hasn't
+    done anything yet doesn't leave a tournament behind.
+    """
+    return registry.checkout(get_tournament_id(), create=create)
+
+
+@app.before_request
+def route_to_shard():
+    """Send requests for another shard's tournament over to that shard."""
+    if registry.num_shards == 1 or request.endpoint in (None, "static"):
+        return None
+    # routes that aren't about a tournament are served by any shard
+    if not app.url_map.is_endpoint_expecting(request.endpoint, "tournament_id"):
+        return None
+    tournament_id = get_tournament_id(create=False)
+    if tournament_id is None or registry.owns(tournament_id):
+        return None
+    path = request.path
+    if g.tournament_id is None:
+        # the other shard can't read this session, so name the tournament
+        path = f"/t/{tournament_id}{path}"
+    if request.query_string:
+        path += "?" + request.query_string.decode()
+    return redirect(SHARD_URLS[registry.owner(tournament_id)] + path, code=307)
+
+
+@app.before_request
+def start_profile():
+    if session.get("profile") and profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profile_start = time.perf_counter()
+        g.profiler.enable()
+
+
+@app.teardown_request
+def stop_profile(exc):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    elapsed = time.perf_counter() - g.profile_start
+    profile_lock.release()
+
+    stats = io.StringIO()
+    pstats.Stats(profiler, stream=stats).sort_stats("cumulative").print_stats(25)
+    tournament_id = get_tournament_id(create=False)
+    if tournament_id is not None:
+        recent = profiles.setdefault(
+            tournament_id, collections.deque(maxlen=MAX_PROFILES)
+        )
+        recent.appendleft({
+            "path": request.full_path.rstrip("?"),
+            "ms": round(elapsed * 1000, 3),
+            "stats": stats.getvalue(),
+        })
+
+
+def render(template_name, **context):
+    with flipper_frenzy.metrics.timer("render_seconds", template=template_name):
+        return render_template(template_name, **context)
+
+
+def cache_key(tournament_id, name, version):
+    """Key a rendered fragment of a tournament by the version it shows.
+
+    Links only point at /t/<tournament_id> if the page was asked for that
+    way, so that's part of the key too.
+    """
+    return tournament_id, name, g.tournament_id, version
+
+
+def cached_render(key, template_name, get_context):
+    """Render the template, or return what was rendered for the same key.
+
+    get_context is only called on a miss. It's called right away, so it
+    can read the tournament inside the caller's checkout.
+    """
+    html = render_cache.get(key)
+    if html is None:
+        html = render(template_name, **get_context())
+        render_cache.put(key, html)
+    return html
+
+
+# the parts of index.html that are cached separately, with the kinds of
+# change (see Tournament.get_changes) that each one shows
+INDEX_FRAGMENTS = {
+    "matches": ("index_matches.html", ("match", "settings")),
+    "players": ("index_players.html", ("player", "queue", "settings")),
+    "machines": ("index_machines.html", ("machine",)),
+}
+
+
+def index_context(t, name):
+    if name == "matches":
+        return {
+            "matches": [match.serialize() for match in t._matches],
+            "pairing": t._pairing.name,
+            "format": t._format.name,
+            "round": getattr(t._format, "round", None),
+            # the winner links say which version of the matches they came from
+            "version": t.last_changed("match"),
+        }
+    if name == "players":
+        return {
+            "players": [player.serialize() for player in t.sorted_players()],
+            "sort_by_rank": t._sort_by_rank,
+        }
+    return {"machines": [machine.serialize() for machine in t.sorted_machines()]}
+
+
+@app.route("/metrics")
+def metrics():
+    text = flipper_frenzy.metrics.render({
+        "tournaments_loaded": len(registry),
+        "event_subscribers": registry.num_subscribers(),
+    })
+    return app.response_class(text, mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/new-tournament")
+def new_tournament():
+    """Start another tournament with its own url, to run alongside this one."""
+    return redirect(url_for("index", tournament_id=registry.new_id()))
+
+
+@tournament_route("/")
 def index():
     message = session.pop("message", None)
-    t = flipper_frenzy.main.Tournament()
-    data = session.get("tournament")
-    if data is not None:
-        t.restore(data)
-    session["tournament"] = t.serialize()
-    print(t._avail_players)
-    return render_template("index.html", message=message, **t.serialize())
-
-
-@app.route("/player/<player_name>")
+    tournament_id = get_tournament_id()
+    fragments = {}
+    with registry.checkout(tournament_id, create=False) as t:
+        for name, (template_name, kinds) in INDEX_FRAGMENTS.items():
+            version = t.last_changed(*kinds)
+            if name == "matches":
+                # archiving old matches shortens the list without a new version
+                version = version, len(t._matches)
+            fragments[f"{name}_html"] = cached_render(
+                cache_key(tournament_id, name, version), template_name,
+                lambda: index_context(t, name),
+            )
+    return render("index.html", message=message, **fragments)
+
+
+@tournament_route("/player/<player_name>")
 def player_detail(player_name):
-    t = flipper_frenzy.main.Tournament()
-    data = session.get("tournament")
-    if data is None:
+    tournament_id = get_tournament_id(create=False)
+    if tournament_id is None or not registry.exists(tournament_id):
         session["message"] = "No tournament data found in current session!"
         return redirect(url_for("index"))
-    t.restore(data)
-    player_data = t.get_player_data(player_name)
-    return render_template("player.html", **player_data)
+    with registry.checkout(tournament_id) as t:
+        version = t.last_changed("player", "machine", "match"), player_name
+        return cached_render(
+            cache_key(tournament_id, "player", version), "player.html",
+            lambda: get_player_data(tournament_id, t, player_name),
+        )
+
 
+def get_player_data(tournament_id, t, player_name):
+    """Tournament.get_player_data, plus the player's archived matches.
 
-@app.route("/add-player", methods=["POST"])
+    Call it inside checkout, so no matches get archived halfway through.
+    """
+    player_data = t.get_player_data(player_name)
+    # a snapshot taken before archiving can still hold archived matches
+    seen = {match["id"] for match in player_data["matches"]}
+    player_data["matches"].extend(
+        flipper_frenzy.main.player_match_data(match, player_name)
+        for match in iter_history(tournament_id, player=player_name)
+        if match["id"] not in seen
+    )
+    return player_data
+
+
+def iter_history(tournament_id, **filters):
+    """Yield every archived match that passes the filters, newest first."""
+    before = filters.pop("before", None)
+    while True:
+        matches = store.get_history(tournament_id, before=before, **filters)
+        yield from matches
+        if len(matches) < flipper_frenzy.store.HISTORY_PAGE:
+            return
+        before = matches[-1]["id"]
+
+
+@tournament_route("/add-player", methods=["POST"])
 def add_player():
     player_name = request.form.get("name")
-    if player_name:
-        data = session["tournament"]
-        t = flipper_frenzy.main.Tournament()
-        t.restore(data)
-        t.add_player(player_name)
-        session["tournament"] = t.serialize()
+    if not player_name:
+        session["message"] = "Name can't be empty!"
+    elif len(player_name.strip()) > flipper_frenzy.main.MAX_NAME_LENGTH:
+        session["message"] = (
+            f"Names can't be longer than {flipper_frenzy.main.MAX_NAME_LENGTH} characters!"
+        )
+    else:
+        with use_tournament() as t:
+            t.add_player(player_name)
         session["message"] = "Player added!"
+    return redirect(url_for("index"))
+
+
+def read_names():
+    """Read the names in an uploaded CSV or JSON file, or None if it can't be.
+
+    JSON has to be a list of names, or of objects with a "name". CSV uses
+    the "name" column if the first row is a header with one, otherwise the
+    first column.
+    """
+    upload = request.files.get("file")
+    text = upload.read() if upload else request.form.get("data", "")
+    try:
+        if isinstance(text, bytes):
+            text = text.decode("utf-8-sig")
+        if text.lstrip().startswith(("[", "{")):
+            items = json.loads(text)
+            if not isinstance(items, list):
+                return None
+            return [
+                str(item["name"] if isinstance(item, dict) else item) for item in items
+            ]
+
+        rows = csv.reader(io.StringIO(text))
+        header = next(rows, [])
+        columns = [cell.strip().lower() for cell in header]
+        if "name" in columns:
+            column = columns.index("name")
+            names = []
+        else:
+            column = 0
+            names = header[:1]
+        names.extend(row[column] for row in rows if len(row) > column)
+        return names
+    except (ValueError, KeyError, TypeError, csv.Error):
+        return None
+
+
+@tournament_route("/import-players", methods=["POST"])
+def import_players():
+    names = read_names()
+    if names is None:
+        session["message"] = "Could not read the uploaded file!"
     else:
-        session["message"] = "Name can't be empty!"
+        with use_tournament() as t:
+            session["message"] = t.add_players(names)
     return redirect(url_for("index"))
 
 
-@app.route("/enable-player/", methods=["GET"])
+@tournament_route("/enable-player/", methods=["GET"])
 def enable_player():
     player_name = request.args.get("player_name")
     enable = request.args.get("enable") == "True"
-    data = session["tournament"]
-    t = flipper_frenzy.main.Tournament()
-    t.restore(data)
-    session["message"] = t.enable_player(player_name, enable)
-    session["tournament"] = t.serialize()
+    with use_tournament() as t:
+        session["message"] = t.enable_player(player_name, enable)
     return redirect(url_for("index"))
 
 
-@app.route("/add-machine", methods=["POST"])
+@tournament_route("/add-machine", methods=["POST"])
 def add_machine():
     machine_name = request.form.get("name")
-    if machine_name:
-        data = session["tournament"]
-        t = flipper_frenzy.main.Tournament()
-        t.restore(data)
-        t.add_machine(machine_name)
-        session["tournament"] = t.serialize()
+    if not machine_name:
+        session["message"] = "Name can't be empty!"
+    elif len(machine_name.strip()) > flipper_frenzy.main.MAX_NAME_LENGTH:
+        session["message"] = (
+            f"Names can't be longer than {flipper_frenzy.main.MAX_NAME_LENGTH} characters!"
+        )
+    else:
+        with use_tournament() as t:
+            t.add_machine(machine_name)
         session["message"] = "Machine added!"
+    return redirect(url_for("index"))
+
+
+@tournament_route("/import-machines", methods=["POST"])
+def import_machines():
+    names = read_names()
+    if names is None:
+        session["message"] = "Could not read the uploaded file!"
     else:
-        session["message"] = "Name can't be empty!"
+        with use_tournament() as t:
+            session["message"] = t.add_machines(names)
     return redirect(url_for("index"))
 
 
-@app.route("/remove-machine/", methods=["GET"])
+@tournament_route("/remove-machine/", methods=["GET"])
 def enable_machine():
     machine_name = request.args.get("machine_name")
     enable = request.args.get("enable") == "True"
-    data = session["tournament"]
-    t = flipper_frenzy.main.Tournament()
-    t.restore(data)
-    session["message"] = t.enable_machine(machine_name, enable)
-    session["tournament"] = t.serialize()
+    with use_tournament() as t:
+        session["message"] = t.enable_machine(machine_name, enable)
     return redirect(url_for("index"))
 
 
-@app.route("/sort/", methods=["GET"])
+@tournament_route("/sort/", methods=["GET"])
 def sort_by():
     by_rank = request.args.get("by_rank") == "True"
-    data = session["tournament"]
-    t = flipper_frenzy.main.Tournament()
-    t.restore(data)
-    t.sort_by(by_rank)
-    session["tournament"] = t.serialize()
+    with use_tournament() as t:
+        t.sort_by(by_rank)
+    return redirect(url_for("index"))
+
+
+@tournament_route("/pairing/", methods=["GET"])
+def set_pairing():
+    with use_tournament() as t:
+        session["message"] = t.set_pairing(request.args.get("name", ""))
+    return redirect(url_for("index"))
+
+
+@tournament_route("/format/", methods=["GET"])
+def set_format():
+    with use_tournament() as t:
+        session["message"] = t.set_format(request.args.get("name", ""))
     return redirect(url_for("index"))
 
 
-@app.route("/next-match", methods=["GET", "POST"])
+@tournament_route("/next-match", methods=["GET", "POST"])
 def next_match():
-    data = session["tournament"]
-    t = flipper_frenzy.main.Tournament()
-    t.restore(data)
-    session["message"] = t.next_match()
-    session["tournament"] = t.serialize()
+    # pairs up whoever is free now, however old the page it came from
+    session["message"] = registry.mutate(get_tournament_id(), "next_match")
+    return redirect(url_for("index"))
+
+
+@tournament_route("/fill-matches", methods=["GET", "POST"])
+def fill_matches():
+    session["message"] = registry.mutate(get_tournament_id(), "fill_matches")
     return redirect(url_for("index"))
 
 
-@app.route("/shuffle", methods=["GET", "POST"])
+@tournament_route("/shuffle", methods=["GET", "POST"])
 def shuffle():
-    data = session["tournament"]
-    t = flipper_frenzy.main.Tournament()
-    t.restore(data)
-    t.shuffle()
+    with use_tournament() as t:
+        t.shuffle()
     session["message"] = "Queue shuffled!"
-    session["tournament"] = t.serialize()
     return redirect(url_for("index"))
 
 
-@app.route("/match-winner", methods=["GET", "POST"])
+@tournament_route("/match-winner", methods=["GET", "POST"])
 def match_winner():
-    data = session["tournament"]
-    t = flipper_frenzy.main.Tournament()
-    t.restore(data)
-    t.complete_match(int(request.args["match_id"]), request.args["player_name"])
-    session["tournament"] = t.serialize()
-    session["message"] = "Match finished!"
+    match_id = int(request.args["match_id"])
+    session["message"] = registry.mutate(
+        get_tournament_id(), "complete_match", match_id, request.args["player_name"],
+        base_version=request.args.get("version", type=int),
+        touches=[("match", match_id)],
+    )
     return redirect(url_for("index"))
 
 
+# exports are streamed, reading the tournament a chunk of rows at a time so
+# it's never locked for long and the whole document is never in memory
+
+def iter_standings(tournament_id):
+    """Yield each player's standing, in the ranking order at the start."""
+    with registry.checkout(tournament_id, create=False) as t:
+        players = list(t._standings)
+    for start in range(0, len(players), EXPORT_CHUNK):
+        with registry.checkout(tournament_id, create=False) as t:
+            rows = []
+            for rank, player in enumerate(players[start:start + EXPORT_CHUNK], start + 1):
+                row = player.serialize()
+                row["rank"] = rank
+                rows.append(row)
+        yield from rows
+
+
+def iter_matches(tournament_id):
+    """Yield every match that existed at the start, newest first.
+
+    The matches in memory come first, then the archived ones.
+    """
+    with registry.checkout(tournament_id, create=False) as t:
+        matches = list(t._matches)
+        next_match_id = t._next_match_id
+    for start in range(0, len(matches), EXPORT_CHUNK):
+        with registry.checkout(tournament_id, create=False) as t:
+            rows = [match.serialize() for match in matches[start:start + EXPORT_CHUNK]]
+        yield from rows
+
+    # skip matches archived since the export started, they're already out
+    seen = {match.id for match in matches}
+    for match in iter_history(tournament_id, before=next_match_id):
+        if match["id"] not in seen:
+            yield match
+
+
+def export_lines(rows, fields, export_format):
+    """Yield the rows as CSV or NDJSON text, a chunk of rows at a time."""
+    buffer = io.StringIO()
+    if export_format == "csv":
+        writer = csv.DictWriter(buffer, fields, extrasaction="ignore")
+        writer.writeheader()
+        write_row = writer.writerow
+    else:
+        def write_row(row):
+            buffer.write(json.dumps({field: row[field] for field in fields}))
+            buffer.write("\n")
+
+    for i, row in enumerate(rows, 1):
+        write_row(row)
+        if i % EXPORT_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@tournament_route("/export/<kind>.<export_format>")
+def export(kind, export_format):
+    if export_format not in EXPORT_MIMETYPES:
+        abort(404)
+    tournament_id = get_tournament_id()
+    if kind == "standings":
+        rows, fields = iter_standings(tournament_id), STANDINGS_FIELDS
+    elif kind == "matches":
+        rows, fields = iter_matches(tournament_id), MATCH_FIELDS
+    else:
+        abort(404)
+    return app.response_class(
+        export_lines(rows, fields, export_format),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{kind}.{export_format}"'
+        },
+    )
+
+
 # TODO revert back to post only
-@app.route("/reset-all", methods=["GET", "POST"])
+@tournament_route("/reset-all", methods=["GET", "POST"])
 def reset_all():
-    session.pop("tournament", None)
+    tournament_id = g.tournament_id
+    if tournament_id is None:
+        tournament_id = session.pop("tournament_id", None)
+    if tournament_id is not None:
+        registry.discard(tournament_id)
+        render_cache.discard(tournament_id)
+        flipper_frenzy.projection.discard(tournament_id)
     session["message"] = "All data cleared!"
     return redirect(url_for("index"))
 
 
 # TODO revert back to post only
-@app.route("/reset-tournament", methods=["GET", "POST"])
+@tournament_route("/reset-tournament", methods=["GET", "POST"])
 def reset_tournament():
-    data = session["tournament"]
-    del data["avail_players"]
-    del data["players"]
-    del data["matches"]
-    t = flipper_frenzy.main.Tournament()
-    t.restore(data)
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id) as t:
+        data = t.serialize()
+        del data["avail_players"]
+        del data["players"]
+        del data["matches"]
+        # the format starts over too, its state names the old players
+        del data["format_state"]
+        t = flipper_frenzy.main.Tournament()
+        t.restore(data)
+        registry.replace(tournament_id, t)
+        store.delete_history(tournament_id)
     session["message"] = "Tournament reset!"
     return redirect(url_for("index"))
 
 
-@app.route("/debug")
+@tournament_route("/debug")
 def debug():
-    t = flipper_frenzy.main.Tournament()
-    data = session.get("tournament")
-    if data is not None:
-        t.restore(data)
+    with use_tournament(create=False) as t:
+        data = json.dumps(t.serialize(), indent=2)
     message = session.pop("message", None)
-    data = json.dumps(t.serialize(), indent=2)
-    return render_template("debug.html", data=data, message=message)
+    return render(
+        "debug.html", data=data, message=message,
+        profile=session.get("profile", False),
+        profiles=list(profiles.get(get_tournament_id(), ())),
+    )
+
+
+@tournament_route("/debug-profile", methods=["GET"])
+def debug_profile():
+    """Turn profiling of this browser's requests on or off."""
+    enable = request.args.get("enable") == "True"
+    session["profile"] = enable
+    session["message"] = f"Profiling {'enabled' if enable else 'disabled'}!"
+    return redirect(url_for("debug"))
 
 
-@app.route("/debug-update", methods=["POST"])
+@tournament_route("/debug-update", methods=["POST"])
 def debug_post():
     data = request.form.get("data")
     t = flipper_frenzy.main.Tournament()
@@ -173,10 +595,254 @@ def debug_post():
         session["message"] = "Could not decode JSON data!"
         return redirect(url_for("debug"))
 
-    session["tournament"] = t.serialize()
+    registry.replace(get_tournament_id(), t)
     session["message"] = "Tournament data updated!"
     return redirect(url_for("index"))
 
 
+# JSON API. every response carries the tournament version as its ETag, so
+# polling clients get an empty 304 back while nothing has changed.
+
+def json_response(tournament_id, t, build):
+    """Respond with build()'s JSON, or a 304 if the client is up to date."""
+    etag = f"{tournament_id}-{t.version}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        data = build()
+        data["version"] = t.version
+        response = jsonify(data)
+    response.set_etag(etag)
+    return response
+
+
+def changes_or_all(t, since, key, serialize_all):
+    """Return the changed items under key if ?since= is usable, else all."""
+    if since is not None:
+        changes = t.serialize_changes(since)
+        if changes is not None:
+            return {key: changes[key], "since": since}
+    return {key: serialize_all()}
+
+
+@tournament_route("/api/standings")
+def api_standings():
+    top = request.args.get("top", type=int)
+    player_name = request.args.get("player")
+
+    def build():
+        data = {"standings": t.get_standings(top)}
+        if player_name:
+            data["player"] = player_name
+            data["rank"] = t.get_rank(player_name)
+        return data
+
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        return json_response(tournament_id, t, build)
+
+
+@tournament_route("/api/queue")
+def api_queue():
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        return json_response(tournament_id, t, lambda: {
+            "avail_players": [p.name for p in t._avail_players],
+        })
+
+
+@tournament_route("/api/matches")
+def api_matches():
+    since = request.args.get("since", type=int)
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        return json_response(tournament_id, t, lambda: changes_or_all(
+            t, since, "matches", lambda: [m.serialize() for m in t._matches]
+        ))
+
+
+@tournament_route("/api/players")
+def api_players():
+    since = request.args.get("since", type=int)
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        return json_response(tournament_id, t, lambda: changes_or_all(
+            t, since, "players",
+            lambda: [p.serialize() for p in t._players.values()],
+        ))
+
+
+@tournament_route("/api/players/<player_name>")
+def api_player_detail(player_name):
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        if player_name not in t._players:
+            return jsonify(error=f"Player '{player_name}' doesn't exist!"), 404
+        return json_response(
+            tournament_id, t, lambda: get_player_data(tournament_id, t, player_name)
+        )
+
+
+@tournament_route("/api/projection")
+def api_projection():
+    """Each player's chance of finishing in each position, best first.
+
+    Simulates ?matches= more matches (by default about two per player)
+    ?runs= times, from the standings as they are now.
+    """
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        if t._format.uses_results:
+            # playing out a schedule made up front would be wrong
+            abort(
+                400, f"Can't project a {t._format.name} event, its pairings depend on results"
+            )
+        wait = flipper_frenzy.projection.project(
+            tournament_id, t,
+            request.args.get("runs", flipper_frenzy.projection.DEFAULT_RUNS, type=int),
+            request.args.get("matches", type=int),
+        )
+    try:
+        return jsonify(wait())
+    except concurrent.futures.TimeoutError:
+        abort(503, "The projection took too long, try fewer runs or matches")
+    except concurrent.futures.process.BrokenProcessPool:
+        abort(503, "The projection failed, try again")
+
+
+def parse_time(value):
+    """Read a unix time or an ISO 8601 date from a query argument."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        abort(400, f"Can't read '{value}' as a time")
+
+
+@tournament_route("/api/history")
+def api_history():
+    """Finished matches, newest first, a page at a time.
+
+    Filter with ?player=, ?machine=, and ?since= and ?until= as unix times
+    or ISO dates. Pass the "next" of a response as ?before= for the page
+    after it.
+    """
+    filters = {
+        "player": request.args.get("player"),
+        "machine": request.args.get("machine"),
+        "start": parse_time(request.args.get("since")),
+        "end": parse_time(request.args.get("until")),
+        "before": request.args.get("before", type=int),
+    }
+    limit = min(
+        request.args.get("limit", flipper_frenzy.store.HISTORY_PAGE, type=int),
+        MAX_HISTORY_PAGE,
+    )
+    if limit < 1:
+        abort(400, "limit has to be at least 1")
+
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        # recent matches are still in memory, older ones in the archive
+        matches = {
+            match["id"]: match
+            for match in store.get_history(tournament_id, limit=limit, **filters)
+        }
+        for match in t._matches:
+            data = match.serialize()
+            if data["winner"] is not None and flipper_frenzy.store.history_filter(
+                data, **filters
+            ):
+                matches[data["id"]] = data
+    matches = sorted(matches.values(), key=lambda match: match["id"], reverse=True)
+    matches = matches[:limit]
+    return jsonify(
+        matches=matches,
+        next=matches[-1]["id"] if len(matches) == limit else None,
+    )
+
+
+@tournament_route("/api/tournament")
+def api_tournament():
+    """Everything at once, or everything that changed with ?since=."""
+    since = request.args.get("since", type=int)
+
+    def build():
+        if since is not None:
+            changes = t.serialize_changes(since)
+            if changes is not None:
+                changes["since"] = since
+                return changes
+        return t.serialize()
+
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        return json_response(tournament_id, t, build)
+
+
+def sse_message(event):
+    return (
+        f"id: {event['version']}\n"
+        f"event: {event['type']}\n"
+        f"data: {json.dumps(event)}\n\n"
+    )
+
+
+def get_catch_up(t, last_version):
+    """Return the event bringing a client at last_version up to date."""
+    if last_version is None or last_version == t.version:
+        return None
+    catch_up = t.serialize_changes(last_version)
+    if catch_up is None:
+        return {"type": "resync", "version": t.version}
+    catch_up["type"] = "changes"
+    return catch_up
+
+
+def get_session_tournament_id(cookie):
+    """Read the tournament id from a session cookie outside of a request."""
+    serializer = app.session_interface.get_signing_serializer(app)
+    try:
+        return serializer.loads(cookie).get("tournament_id")
+    except Exception:
+        return None
+
+
+@tournament_route("/api/events")
+def api_events():
+    """Stream the tournament's events to the client as server-sent events.
+
+    A reconnecting client sends the last version it saw as Last-Event-ID
+    and first gets a "changes" event with everything it missed, or a
+    "resync" event if that's too far back.
+    """
+    last_version = request.headers.get("Last-Event-ID", type=int)
+    tournament_id = get_tournament_id()
+    with registry.checkout(tournament_id, create=False) as t:
+        subscription = registry.get_broadcaster(tournament_id).subscribe()
+        catch_up = get_catch_up(t, last_version)
+
+    def stream():
+        with subscription:
+            if catch_up is not None:
+                yield sse_message(catch_up)
+            while True:
+                event = subscription.get(timeout=EVENTS_KEEPALIVE)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield sse_message(event)
+
+    return app.response_class(
+        stream(), mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=3000)
@@ -0,0 +1,160 @@
+"""ASGI entry point, for serving lots of live scoreboard clients at once.
+
+Run a single process with:
+
+    uvicorn flipper_frenzy.asgi:app --host 0.0.0.0 --port 3000
+
+or under gunicorn with:
+
+    gunicorn -k uvicorn.workers.UvicornWorker flipper_frenzy.asgi:app
+
+which runs a single worker, see gunicorn.conf.py.
+
+Event streams (/api/events) are served right here on the event loop, so an
+idle subscriber costs an asyncio queue instead of a whole worker thread.
+Every other request is handed to the Flask app in a thread, where the
+registry's per-tournament locks keep mutations serialized.
+
+Gunicorn spreads connections over its workers at random, and each would
+keep its own copy of every tournament, so to run more than one process
+start a gunicorn per process, give each its own port, list them all in
+FLIPPER_FRENZY_SHARD_URLS and set FLIPPER_FRENZY_SHARD to each one's
+position in that list. Every tournament then lives in exactly one process
+and requests that land elsewhere are redirected to it.
+"""
+import asyncio
+import os
+import re
+from http.cookies import SimpleCookie
+
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+import flipper_frenzy.app
+import flipper_frenzy.broadcast
+
+# threads for running the Flask app's requests
+flask_app = WSGIMiddleware(
+    flipper_frenzy.app.app,
+    workers=int(os.environ.get("FLIPPER_FRENZY_WSGI_WORKERS", "10")),
+)
+registry = flipper_frenzy.app.registry
+
+EVENTS_PATH = re.compile(r"^(?:/t/([^/]+))?/api/events$")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    match = EVENTS_PATH.match(scope["path"]) if scope["type"] == "http" else None
+    if match is None:
+        await flask_app(scope, receive, send)
+        return
+    tournament_id = match.group(1) or get_tournament_id(scope)
+    if tournament_id is not None and not registry.owns(tournament_id):
+        # let Flask redirect it to the shard that owns the tournament
+        await flask_app(scope, receive, send)
+    else:
+        await stream_events(scope, receive, send, tournament_id)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def get_header(scope, name):
+    for key, value in scope["headers"]:
+        if key.decode("latin-1").lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def get_tournament_id(scope):
+    cookie = SimpleCookie(get_header(scope, "cookie") or "")
+    session_cookie = cookie.get(flipper_frenzy.app.app.config["SESSION_COOKIE_NAME"])
+    if session_cookie is None:
+        return None
+    return flipper_frenzy.app.get_session_tournament_id(session_cookie.value)
+
+
+async def stream_events(scope, receive, send, tournament_id):
+    """Async version of flipper_frenzy.app.api_events."""
+    if tournament_id is None:
+        await send({
+            "type": "http.response.start", "status": 404,
+            "headers": [(b"content-type", b"text/plain")],
+        })
+        await send({
+            "type": "http.response.body",
+            "body": b"No tournament data found in current session!",
+        })
+        return
+
+    last_version = get_header(scope, "last-event-id")
+    last_version = int(last_version) if last_version and last_version.isdigit() else None
+
+    # taking the tournament's lock can block, so do it in a worker thread
+    broadcaster = await run_in_thread(registry.get_broadcaster, tournament_id)
+    subscription = flipper_frenzy.broadcast.AsyncSubscription(broadcaster)
+
+    def subscribe():
+        with registry.checkout(tournament_id, create=False) as t:
+            broadcaster.add(subscription)
+            return flipper_frenzy.app.get_catch_up(t, last_version)
+
+    catch_up = await run_in_thread(subscribe)
+
+    await send({
+        "type": "http.response.start", "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        if catch_up is not None:
+            await send_body(send, flipper_frenzy.app.sse_message(catch_up))
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(
+                subscription.get(flipper_frenzy.app.EVENTS_KEEPALIVE)
+            )
+            await asyncio.wait(
+                {next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not next_event.done():
+                next_event.cancel()
+                break
+            event = next_event.result()
+            if event is None:
+                await send_body(send, ": keep-alive\n\n")
+            else:
+                await send_body(send, flipper_frenzy.app.sse_message(event))
+    finally:
+        subscription.close()
+        disconnected.cancel()
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def send_body(send, text):
+    await send({
+        "type": "http.response.body", "body": text.encode(), "more_body": True,
+    })
+
+
+async def run_in_thread(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
@@ -0,0 +1,115 @@
+import asyncio
+import queue
+import threading
+
+# how many events a subscriber can fall behind before being told to resync
+MAX_PENDING = 100
+
+
+class Subscription:
+    """One subscriber's queue of events from a Broadcaster."""
+
+    def __init__(self, broadcaster, max_pending=MAX_PENDING):
+        self._broadcaster = broadcaster
+        self._queue = queue.Queue(max_pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # too far behind to catch up, so drop what's pending and have
+            # the client fetch the current state instead
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._queue.put_nowait({"type": "resync", "version": event["version"]})
+
+    def get(self, timeout=None):
+        """Return the next event, or None if none arrived within timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+
+class AsyncSubscription:
+    """A subscriber's queue of events, for use from an asyncio event loop.
+
+    Events are published from whichever thread mutated the tournament, so
+    they're handed over to the loop with call_soon_threadsafe. Create it on
+    the loop that will read from it.
+    """
+
+    def __init__(self, broadcaster, max_pending=MAX_PENDING):
+        self._broadcaster = broadcaster
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(max_pending)
+
+    def put(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # the loop has shut down, nobody is listening anymore
+            self.close()
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait({"type": "resync", "version": event["version"]})
+
+    async def get(self, timeout=None):
+        """Return the next event, or None if none arrived within timeout."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+
+class Broadcaster:
+    """Fan a tournament's events out to any number of subscribers.
+
+    publish is added as a listener on the Tournament, so every mutation is
+    pushed once to each subscriber's queue without anyone polling.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, max_pending=MAX_PENDING):
+        return self.add(Subscription(self, max_pending))
+
+    def add(self, subscription):
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
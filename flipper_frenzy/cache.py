@@ -0,0 +1,57 @@
+import collections
+import threading
+
+import flipper_frenzy.metrics
+
+# characters of rendered html to keep, across every tournament
+MAX_SIZE = 32 * 1024 * 1024
+
+
+class RenderCache:
+    """Least recently used cache of rendered html, bounded by total size.
+
+    Keys start with the tournament id and include the version the
+    fragment was last changed at, so a mutation makes the fragments it
+    touched miss and leaves the rest alone. Stale entries are never looked
+    up again and just age out.
+    """
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the html cached under key, or None."""
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+        flipper_frenzy.metrics.count(
+            "render_cache_hits_total" if html is not None else "render_cache_misses_total",
+            fragment=key[1],
+        )
+        return html
+
+    def put(self, key, html):
+        if len(html) > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = html
+            self.size += len(html)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def discard(self, tournament_id):
+        """Drop a tournament's entries, e.g. once its versions start over."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == tournament_id]:
+                self.size -= len(self._entries.pop(key))
@@ -0,0 +1,394 @@
+"""Tournament formats, which decide who plays whom and when.
+
+The rolling format is the original one: players queue up, and as soon as a
+machine is free the tournament's pairing strategy (see
+flipper_frenzy.pairing) puts on players who haven't faced each other yet.
+
+The other formats play in rounds. Once a round is over, Tournament.start_round
+works out every pair of the next one in a single pass, and the pairs are
+then put on machines as they come free, preferring machines neither
+player has played yet. A pair with a disabled player doesn't hold the
+round up, it's dropped (or forfeited, in a knockout) when the next round
+starts.
+
+A format's state is a dict of plain names and numbers, so it can be put in
+snapshots and journal events as it is.
+"""
+
+# the most pairs the Swiss format tries before allowing rematches
+SEARCH_LIMIT = 10000
+
+
+def can_play(t, name):
+    """Whether the named player is still in the tournament and enabled."""
+    player = t._players.get(name)
+    return player is not None and player.enabled
+
+
+class RollingFormat:
+    """Pair whoever is waiting, with the tournament's pairing strategy."""
+
+    name = "rolling"
+    rounds = False
+    # whether who plays whom depends on who won earlier matches
+    uses_results = False
+
+    def find_matches(self, t, check_machines=True, limit=None):
+        """Return (player_a, player_b, machine) for matches to start now."""
+        return t._pairing.find_matches(t, check_machines=check_machines, limit=limit)
+
+    def match_started(self, player_a, player_b):
+        """Called by Tournament.start_match, when replaying too."""
+
+    def match_completed(self, match):
+        """Called by Tournament.complete_match, when replaying too."""
+
+    def serialize(self):
+        return {}
+
+    def restore(self, data):
+        pass
+
+
+class RoundFormat(RollingFormat):
+    """The scheduling shared by formats that play in rounds.
+
+    Subclasses only have to say who plays whom in the next round, with
+    pair_round, and what to say once the event is over.
+    """
+
+    rounds = True
+    # whether sitting a round out counts as winning a match
+    bye_wins = False
+
+    def __init__(self):
+        self.round = 0
+        self.pairs = []  # every pair of this round, as player names
+        self.pending = []  # the pairs that haven't started yet
+
+    def pair_round(self, t):
+        """Return the next round's pairs of player names, or None if it's over.
+
+        A pair can have None in it for a bye, which isn't played.
+        """
+        raise NotImplementedError
+
+    def finished_message(self, t):
+        return "Not enough players for another round!"
+
+    def begin_round(self, pairs):
+        self.round += 1
+        self.pairs = [tuple(pair) for pair in pairs]
+        self.pending = [pair for pair in self.pairs if None not in pair]
+
+    def round_over(self, t):
+        """Whether every match of the round that can be played was played."""
+        if any(machine.active for machine in t._machines.values()):
+            return False
+        return not any(can_play(t, a) and can_play(t, b) for a, b in self.pending)
+
+    def find_matches(self, t, check_machines=True, limit=None):
+        free_machines = [
+            m for m in t._machines.values() if m.enabled and not m.active
+        ]
+        found = []
+        for name_a, name_b in self.pending:
+            if not free_machines or len(found) == limit:
+                break
+            if not (can_play(t, name_a) and can_play(t, name_b)):
+                continue
+            player_a = t._players[name_a]
+            player_b = t._players[name_b]
+            if player_a.active or player_b.active:
+                continue
+            # rounds have to be played, so any machine will do, but one
+            # neither player has played yet is best
+            machine = max(free_machines, key=lambda m: (
+                bool(m.players_mask & player_a.bit) + bool(m.players_mask & player_b.bit)
+            ))
+            free_machines.remove(machine)
+            found.append((player_a, player_b, machine))
+        return found
+
+    def match_started(self, player_a, player_b):
+        for pair in ((player_a.name, player_b.name), (player_b.name, player_a.name)):
+            if pair in self.pending:
+                self.pending.remove(pair)
+                return
+
+    def serialize(self):
+        return {
+            "round": self.round,
+            "pairs": [list(pair) for pair in self.pairs],
+            "pending": [list(pair) for pair in self.pending],
+        }
+
+    def restore(self, data):
+        self.round = data.get("round", 0)
+        self.pairs = [tuple(pair) for pair in data.get("pairs", [])]
+        self.pending = [tuple(pair) for pair in data.get("pending", [])]
+
+
+class SwissFormat(RoundFormat):
+    """Pair players with the same number of wins, avoiding rematches.
+
+    Players are taken best first, grouped by wins and ranked within each
+    group. Each one is paired with the next player they haven't faced this
+    rotation, dropping down to a lower group if their own group has no one
+    left. If that leaves someone with only old opponents, earlier pairs are
+    undone and the next choice tried, and only if no pairing without a
+    rematch turns up within SEARCH_LIMIT pairs is each player paired with
+    the next player regardless. With an odd number of players the lowest
+    placed player who hasn't had a bye yet sits the round out, which counts
+    as a win.
+    """
+
+    name = "swiss"
+    uses_results = True
+    bye_wins = True
+
+    def __init__(self):
+        super().__init__()
+        self.byes = []
+
+    def pair_round(self, t):
+        players = [p for p in t._standings if p.enabled]
+        if len(players) < 2:
+            return None
+        # stable, so players stay in ranking order within each group
+        players.sort(key=lambda p: -p.num_wins)
+
+        pairs = []
+        if len(players) % 2:
+            had_bye = set(self.byes)
+            bye = next((p for p in reversed(players) if p.name not in had_bye), None)
+            if bye is None:
+                # everyone has had one, start over
+                self.byes = []
+                bye = players[-1]
+            self.byes.append(bye.name)
+            players.remove(bye)
+            pairs.append((bye.name, None))
+
+        found = pair_without_rematches(players)
+        if found is None:
+            found = pair_in_order(players)
+        pairs.extend((player_a.name, player_b.name) for player_a, player_b in found)
+        return pairs
+
+    def serialize(self):
+        data = super().serialize()
+        data["byes"] = self.byes
+        return data
+
+    def restore(self, data):
+        super().restore(data)
+        self.byes = list(data.get("byes", []))
+
+
+def pair_without_rematches(players, limit=SEARCH_LIMIT):
+    """Pair players who haven't faced each other, each as early in order as can be.
+
+    A depth first search that pairs the first player left with the next one
+    they haven't faced, going back to the last pair made whenever someone
+    is left with no one. Returns the pairs, or None if there isn't a
+    pairing or it takes more than limit pairs to find one.
+    """
+    faced = [player.opponents_mask | player.faced_by_mask for player in players]
+    paired = [False] * len(players)
+    pairs = []  # (i, j) indexes into players
+    i = j = 0
+    for _ in range(limit):
+        # pair the first player left with the first unfaced one from j on
+        while i < len(players) and paired[i]:
+            i += 1
+        if i == len(players):
+            return [(players[a], players[b]) for a, b in pairs]
+        paired[i] = True
+        j = max(j, i + 1)
+        while j < len(players) and (paired[j] or players[j].bit & faced[i]):
+            j += 1
+        if j < len(players):
+            paired[j] = True
+            pairs.append((i, j))
+            j = 0
+            continue
+
+        # no one left for i, so try the last pair made with its next choice
+        paired[i] = False
+        if not pairs:
+            return None
+        i, j = pairs.pop()
+        paired[i] = paired[j] = False
+        j += 1
+    return None
+
+
+def pair_in_order(players):
+    """Pair each player with the next one they haven't faced, or the next one."""
+    remaining = 0
+    for player in players:
+        remaining |= player.bit
+    pairs = []
+    for i, player_a in enumerate(players):
+        if not remaining & player_a.bit:
+            continue
+        remaining &= ~player_a.bit
+        unfaced = remaining & ~player_a.opponents_mask & ~player_a.faced_by_mask
+        wanted = unfaced or remaining
+        for player_b in players[i + 1:]:
+            if wanted & player_b.bit:
+                break
+        remaining &= ~player_b.bit
+        pairs.append((player_a, player_b))
+    return pairs
+
+
+class RoundRobinFormat(RoundFormat):
+    """Everyone plays everyone once, scheduled with the circle method.
+
+    The players enabled at the first round are put in ranking order, with
+    an empty seat if there's an odd number of them. Each round the first
+    player stays put and the rest move one seat round the circle, and
+    players opposite each other play, so every round falls straight out
+    of the seating and no pair comes up twice.
+    """
+
+    name = "round_robin"
+
+    def __init__(self):
+        super().__init__()
+        self.seats = []
+
+    def pair_round(self, t):
+        seats = self.seats
+        if not seats:
+            seats = [p.name for p in t._standings if p.enabled]
+            if len(seats) < 2:
+                return None
+            if len(seats) % 2:
+                seats.append(None)
+        num_seats = len(seats)
+        if self.round >= num_seats - 1:
+            return None
+        self.seats = seats
+
+        shift = self.round
+        seats = [seats[0]] + [
+            seats[1 + (i - shift) % (num_seats - 1)] for i in range(num_seats - 1)
+        ]
+        return [(seats[i], seats[num_seats - 1 - i]) for i in range(num_seats // 2)]
+
+    def finished_message(self, t):
+        if not self.seats:
+            return super().finished_message(t)
+        return "The round robin is over, everyone has played everyone!"
+
+    def serialize(self):
+        data = super().serialize()
+        data["seats"] = self.seats
+        return data
+
+    def restore(self, data):
+        super().restore(data)
+        self.seats = list(data.get("seats", []))
+
+
+def seed_order(size):
+    """Return the bracket position of each seed, for a power of two size.
+
+    Seeds meet in the usual order, 1 plays the last seed, 2 the second
+    last and so on, and the top seeds only meet in the late rounds.
+    """
+    order = [0]
+    while len(order) < size:
+        num_seeds = len(order) * 2
+        order = [seed for top in order for seed in (top, num_seeds - 1 - top)]
+    return order
+
+
+class KnockoutFormat(RoundFormat):
+    """Single elimination, seeded from the standings at the first round.
+
+    The bracket is filled up to a power of two with byes, which go to the
+    top seeds. Losers are out, and so is anyone disabled when their match
+    comes up, which counts as a forfeit.
+    """
+
+    name = "knockout"
+    uses_results = True
+
+    def __init__(self):
+        super().__init__()
+        self.out = []
+
+    def _next_slots(self, t):
+        """Return the next round's bracket slots and who forfeited their way out."""
+        if self.round == 0:
+            players = [p.name for p in t._standings if p.enabled]
+            size = 1 << max(len(players) - 1, 0).bit_length()
+            slots = [
+                players[seed] if seed < len(players) else None
+                for seed in seed_order(size)
+            ]
+            return slots, []
+
+        # whoever is left of each pair of the last round goes through
+        out = set(self.out)
+        slots = []
+        forfeits = []
+        for pair in self.pairs:
+            through = None
+            for name in pair:
+                if name is None or name in out:
+                    continue
+                if can_play(t, name) and through is None:
+                    through = name
+                else:
+                    forfeits.append(name)
+            slots.append(through)
+        return slots, forfeits
+
+    def pair_round(self, t):
+        slots, forfeits = self._next_slots(t)
+        if sum(name is not None for name in slots) < 2:
+            return None
+        self.out.extend(forfeits)
+        return [(slots[i], slots[i + 1]) for i in range(0, len(slots), 2)]
+
+    def match_completed(self, match):
+        pair = (match.player_a.name, match.player_b.name)
+        if pair in self.pairs or pair[::-1] in self.pairs:
+            loser = match.player_b if match.winner is match.player_a else match.player_a
+            self.out.append(loser.name)
+
+    def finished_message(self, t):
+        if self.round:
+            # the winner of the final, even if they've gone home since
+            out = set(self.out)
+            entrants = [
+                name for pair in self.pairs for name in pair
+                if name is not None and name not in out
+            ]
+            if len(entrants) != 1:
+                entrants = [name for name in self._next_slots(t)[0] if name is not None]
+            if len(entrants) == 1:
+                return f"'{entrants[0]}' won the knockout!"
+        return super().finished_message(t)
+
+    def serialize(self):
+        data = super().serialize()
+        data["out"] = self.out
+        return data
+
+    def restore(self, data):
+        super().restore(data)
+        self.out = list(data.get("out", []))
+
+
+FORMATS = {
+    RollingFormat.name: RollingFormat,
+    SwissFormat.name: SwissFormat,
+    RoundRobinFormat.name: RoundRobinFormat,
+    KnockoutFormat.name: KnockoutFormat,
+}
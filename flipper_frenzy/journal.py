@@ -0,0 +1,97 @@
+import flipper_frenzy.main
+import flipper_frenzy.snapshot
+
+# number of events to journal before writing a fresh snapshot
+SNAPSHOT_INTERVAL = 100
+
+
+def apply_event(t, event):
+    """Re-apply a single journaled mutation to a tournament."""
+    event_type = event["type"]
+    if event_type == "add_player":
+        t.add_player(event["name"])
+    elif event_type == "enable_player":
+        t.enable_player(event["name"], event["enable"])
+    elif event_type == "add_machine":
+        t.add_machine(event["name"], enabled=event["enabled"])
+    elif event_type == "enable_machine":
+        t.enable_machine(event["name"], event["enable"])
+    elif event_type == "add_players":
+        t.add_players(event["names"])
+    elif event_type == "add_machines":
+        t.add_machines(event["names"], enabled=event["enabled"])
+    elif event_type == "add_machine_to_player":
+        t.add_machine_to_player(event["player"], event["machine"])
+    elif event_type == "sort_by":
+        t.sort_by(event["by_rank"])
+    elif event_type == "set_pairing":
+        t.set_pairing(event["name"])
+    elif event_type == "set_format":
+        t.set_format(event["name"])
+    elif event_type == "start_round":
+        t.start_round(state=event["state"])
+    elif event_type == "shuffle":
+        t.set_queue(event["order"])
+    elif event_type == "next_match":
+        # replay the recorded pairing rather than searching for one again
+        t.start_match(
+            t._players[event["player_a"]],
+            t._players[event["player_b"]],
+            t._machines[event["machine"]],
+            match_id=event["id"],
+        )
+    elif event_type == "complete_match":
+        t.complete_match(event["id"], event["winner"], completed_at=event.get("time"))
+    else:
+        raise ValueError(f"Unknown event type '{event_type}'")
+
+
+class Journal:
+    """Append-only log of the mutations made to one tournament.
+
+    Every mutation is appended to the store as a small event. Once enough
+    events have piled up a full binary snapshot is written instead, which
+    also truncates the events. Loading restores the latest snapshot and replays
+    the events recorded after it.
+    """
+
+    def __init__(self, store, tournament_id, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.store = store
+        self.tournament_id = tournament_id
+        self.snapshot_interval = snapshot_interval
+        self.num_events = 0
+
+    def record(self, event):
+        self.store.append_event(self.tournament_id, event)
+        self.num_events += 1
+
+    def snapshot(self, t):
+        self.store.put(self.tournament_id, flipper_frenzy.snapshot.dumps(t))
+        self.num_events = 0
+
+    def maybe_snapshot(self, t):
+        if self.num_events >= self.snapshot_interval:
+            self.snapshot(t)
+
+    def load(self):
+        """Rebuild the tournament, or return None if nothing was stored."""
+        data = self.store.get(self.tournament_id)
+        events = self.store.get_events(self.tournament_id)
+        if data is None and not events:
+            return None
+
+        if data is not None:
+            t = flipper_frenzy.snapshot.loads(data)
+        else:
+            t = flipper_frenzy.main.Tournament()
+        for event in events:
+            apply_event(t, event)
+        self.num_events = len(events)
+        return t
+
+    def attach(self, t):
+        """Start journaling the tournament's mutations."""
+        t.add_listener(self.record)
+
+    def detach(self, t):
+        t.remove_listener(self.record)
@@ -1,6 +1,23 @@
+import bisect
 import copy
-import itertools
 import random
+import struct
+import time
+
+import flipper_frenzy.formats
+import flipper_frenzy.metrics
+import flipper_frenzy.pairing
+
+# how many entries of the change log to keep, see Tournament.get_changes
+MAX_CHANGES = 10000
+
+# a match packed into a fixed size record: its id, the ids of both players
+# and the machine, the winner's id or -1 while it's being played, and when
+# it was completed as a unix time, or 0
+MATCH_RECORD = struct.Struct("<IIIIid")
+
+# longest player or machine name, well within the u16 lengths of a snapshot
+MAX_NAME_LENGTH = 100
 
 # TODO reset scores button
 # TODO remove active player
@@ -11,11 +28,58 @@ import random
 # TODO manually enter match?
 
 
+def iter_bits(mask, items):
+    """Yield the items whose ids are set in the bitset mask."""
+    while mask:
+        low_bit = mask & -mask
+        yield items[low_bit.bit_length() - 1]
+        mask ^= low_bit
+
+
+def player_match_data(match_data, player_name):
+    """Turn a serialized match around so it's from the player's side."""
+    match_data["won"] = match_data["winner"] == player_name
+    if match_data["player_a"] != player_name:
+        match_data["player_a"], match_data["player_b"] = (
+            match_data["player_b"], match_data["player_a"]
+        )
+    return match_data
+
+
+class Roster:
+    """Interns a tournament's players and machines to integer ids.
+
+    Ids are handed out in the order things are added and double as bit
+    positions, so sets of players or machines can be stored as int bitsets.
+    """
+
+    __slots__ = ("players", "machines")
+
+    def __init__(self):
+        self.players = []
+        self.machines = []
+
+    def add_player(self, player):
+        player.id = len(self.players)
+        player.bit = 1 << player.id
+        self.players.append(player)
+
+    def add_machine(self, machine):
+        machine.id = len(self.machines)
+        machine.bit = 1 << machine.id
+        self.machines.append(machine)
+
+
 class Machine:
+    __slots__ = ("name", "id", "bit", "active", "enabled", "players_mask")
+
     def __init__(self, name, enabled):
         self.name = name
+        self.id = None  # set by Roster.add_machine
+        self.bit = 0
         self.active = False
         self.enabled = enabled
+        self.players_mask = 0  # bits of the players that still need to play it
 
     def __repr__(self):
         return f"<Machine {self.name} ({'X' if self.active else 'O'})>"
@@ -29,18 +93,32 @@ class Machine:
 
 
 class Player:
+    __slots__ = (
+        "name", "id", "bit", "num_wins", "num_losses", "num_played", "active",
+        "enabled", "opponents_mask", "faced_by_mask", "machines_mask", "rounds",
+        "machine_rounds", "_ratio", "_roster",
+    )
+
     def __init__(
-        self, name, machines, num_wins=0, num_losses=0, num_played=0, enabled=True,
+        self, name, roster, num_wins=0, num_losses=0, num_played=0, enabled=True,
+        rounds=0, machine_rounds=0,
     ):
         self.name = name
+        self.id = None  # set by Roster.add_player
+        self.bit = 0
         self.num_wins = num_wins
         self.num_losses = num_losses
         self.num_played = num_played
         self.active = False
         self.enabled = enabled
-        self.opponents = set()  # other players already faced
-        self.machines = machines  # machines still to play
+        self.opponents_mask = 0  # other players already faced
+        self.faced_by_mask = 0  # players with this player in their opponents
+        self.machines_mask = 0  # machines still to play
+        # times the player has faced everyone, and played every machine
+        self.rounds = rounds
+        self.machine_rounds = machine_rounds
         self._ratio = 0
+        self._roster = roster
         self.calc_ratio()
 
     def calc_ratio(self):
@@ -57,6 +135,14 @@ class Player:
     def ratio(self):
         return self._ratio
 
+    @property
+    def opponents(self):
+        return set(iter_bits(self.opponents_mask, self._roster.players))
+
+    @property
+    def machines(self):
+        return set(iter_bits(self.machines_mask, self._roster.machines))
+
     def serialize(self):
         return {
             "name": self.name,
@@ -64,20 +150,31 @@ class Player:
             "num_wins": self.num_wins,
             "num_losses": self.num_losses,
             "num_played": self.num_played,
-            "opponents": [o.name for o in self.opponents],
-            "machines": [m.name for m in self.machines],
+            "opponents": [
+                o.name for o in iter_bits(self.opponents_mask, self._roster.players)
+            ],
+            "machines": [
+                m.name for m in iter_bits(self.machines_mask, self._roster.machines)
+            ],
             "enabled": self.enabled,
             "ratio": self._ratio,
+            "rounds": self.rounds,
+            "machine_rounds": self.machine_rounds,
         }
 
 
 class Match:
-    def __init__(self, match_id, player_a, player_b, machine, winner=None):
+    __slots__ = ("id", "player_a", "player_b", "machine", "winner", "completed_at")
+
+    def __init__(
+        self, match_id, player_a, player_b, machine, winner=None, completed_at=None,
+    ):
         self.id = match_id
         self.player_a = player_a
         self.player_b = player_b
         self.machine = machine
         self.winner = winner
+        self.completed_at = completed_at  # unix time, if known
 
         if winner is None:
             player_a.active = True
@@ -100,8 +197,17 @@ class Match:
             "player_b": self.player_b.name,
             "machine_name": self.machine.name,
             "winner": winner_name,
+            "completed_at": self.completed_at,
         }
 
+    def record(self):
+        """Return the fields of the match's packed record, see MATCH_RECORD."""
+        winner_id = self.winner.id if self.winner is not None else -1
+        return (
+            self.id, self.player_a.id, self.player_b.id, self.machine.id, winner_id,
+            self.completed_at or 0,
+        )
+
     def set_winner(self, winner):
         assert self.winner is None
         self.winner = winner
@@ -124,32 +230,498 @@ class Match:
         self.machine.active = False
 
 
+class PlayerQueue:
+    """First in, first out queue of players waiting for a match.
+
+    Backed by an insertion-ordered dict mapping each player to a ticket
+    number that only ever goes up, so membership, append, removal and
+    comparing two players' places in the queue are all O(1).
+    """
+
+    def __init__(self, players=()):
+        self._tickets = {}
+        self._next_ticket = 0
+        for player in players:
+            self.append(player)
+
+    def __contains__(self, player):
+        return player in self._tickets
+
+    def __iter__(self):
+        return iter(self._tickets)
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def __repr__(self):
+        return f"<PlayerQueue {list(self._tickets)}>"
+
+    def append(self, player):
+        """Add a player to the back of the queue, if not already queued."""
+        if player not in self._tickets:
+            self._tickets[player] = self._next_ticket
+            self._next_ticket += 1
+
+    def remove(self, player):
+        del self._tickets[player]
+
+    def order_key(self, player, default=None):
+        """Return a key that sorts players in queue order."""
+        return self._tickets.get(player, default)
+
+    def set_order(self, players):
+        self._tickets = {}
+        for player in players:
+            self.append(player)
+
+
+class Standings:
+    """Players in ranking order, updated in place as results come in.
+
+    Players are kept in a list sorted by rank_key alongside the matching
+    keys, so reading the standings needs no sort and updating one player
+    is a binary search and a list insert.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._players = []
+        self._key_of = {}
+
+    @staticmethod
+    def rank_key(player):
+        return (-player.enabled, -player.ratio, player.num_played, player.name)
+
+    def __iter__(self):
+        return iter(self._players)
+
+    def __len__(self):
+        return len(self._players)
+
+    def add(self, player):
+        key = self._key_of[player] = self.rank_key(player)
+        i = bisect.bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._players.insert(i, player)
+
+    def update(self, player):
+        """Move a player to their new place after their stats changed."""
+        key = self.rank_key(player)
+        old_key = self._key_of[player]
+        if key == old_key:
+            return
+        i = bisect.bisect_left(self._keys, old_key)
+        del self._keys[i]
+        del self._players[i]
+        self.add(player)
+
+    def top(self, k):
+        return self._players[:k]
+
+    def rank(self, player):
+        """Return the player's 1-based position in the standings."""
+        return bisect.bisect_left(self._keys, self._key_of[player]) + 1
+
+
+class MatchHistory:
+    """Every match in a tournament, newest first, by id and by player.
+
+    Matches loaded from a binary snapshot are kept as their packed records
+    and only turned into Match objects once something reads them, so
+    loading a tournament doesn't get slower the longer it has run. Matches
+    still being played are unpacked straight away, as they mark their
+    players and machine as active.
+
+    Finished matches never change, so packing the history again copies the
+    loaded records as they are and only re-packs the ones that were still
+    being played when they were loaded.
+    """
+
+    def __init__(self, roster):
+        self._roster = roster
+        self._reset()
+
+    def _reset(self):
+        self._matches = []  # matches added since loading, newest first
+        self._by_id = {}  # every match unpacked so far
+        self._by_player = {}  # player -> their matches in self._matches
+
+        # packed records, newest first and all older than self._matches
+        self._packed = b""
+        self._num_packed = 0
+        self._unpacked = {}  # record index -> Match
+        self._active_at_load = []  # record indexes, the only ones that change
+        self._packed_ids = None  # match id -> record index, built when needed
+        self._packed_by_player = None  # player id -> record indexes
+
+    def __len__(self):
+        return len(self._matches) + self._num_packed
+
+    def __iter__(self):
+        yield from self._matches
+        for index in range(self._num_packed):
+            yield self._unpack(index)
+
+    def __getitem__(self, index):
+        """Return the match at a position, counting from the newest."""
+        if index < len(self._matches):
+            return self._matches[index]
+        index -= len(self._matches)
+        if not 0 <= index < self._num_packed:
+            raise IndexError("match index out of range")
+        return self._unpack(index)
+
+    def get(self, match_id):
+        """Return the match with the given id, or raise KeyError."""
+        match = self.find(match_id)
+        if match is None:
+            raise KeyError(match_id)
+        return match
+
+    def find(self, match_id):
+        """Return the match with the given id, or None."""
+        match = self._by_id.get(match_id)
+        if match is None:
+            index = self._find_packed(match_id)
+            if index is not None:
+                match = self._unpack(index)
+        return match
+
+    def for_player(self, player):
+        """Return the player's matches, newest first."""
+        matches = list(self._by_player.get(player, ()))
+        if self._num_packed:
+            if self._packed_by_player is None:
+                self._packed_by_player = {}
+                for index, record in enumerate(MATCH_RECORD.iter_unpack(self._packed)):
+                    self._packed_by_player.setdefault(record[1], []).append(index)
+                    self._packed_by_player.setdefault(record[2], []).append(index)
+            for index in self._packed_by_player.get(player.id, ()):
+                matches.append(self._unpack(index))
+        return matches
+
+    def add(self, match):
+        """Add a match that just started."""
+        self._matches.insert(0, match)
+        self._by_id[match.id] = match
+        for player in (match.player_a, match.player_b):
+            self._by_player.setdefault(player, []).insert(0, match)
+
+    def append(self, match):
+        """Add a match older than all the others, when restoring."""
+        assert not self._num_packed
+        self._matches.append(match)
+        self._by_id[match.id] = match
+        for player in (match.player_a, match.player_b):
+            self._by_player.setdefault(player, []).append(match)
+
+    def load(self, records, active=None):
+        """Take packed records, newest first, as the whole history.
+
+        active lists the indexes of the records still being played. If it
+        isn't known every record is checked.
+        """
+        assert not self
+        self._packed = bytes(records)
+        self._num_packed = len(self._packed) // MATCH_RECORD.size
+        if active is None:
+            active = [
+                index
+                for index, record in enumerate(MATCH_RECORD.iter_unpack(self._packed))
+                if record[4] < 0
+            ]
+        self._active_at_load = list(active)
+        for index in self._active_at_load:
+            self._unpack(index)
+
+    def pack(self):
+        """Return every match as packed records, newest first."""
+        parts = [MATCH_RECORD.pack(*match.record()) for match in self._matches]
+        if self._active_at_load:
+            packed = bytearray(self._packed)
+            for index in self._active_at_load:
+                MATCH_RECORD.pack_into(
+                    packed, index * MATCH_RECORD.size, *self._unpacked[index].record()
+                )
+            parts.append(packed)
+        else:
+            parts.append(self._packed)
+        return b"".join(parts)
+
+    def prune(self, keep):
+        """Drop all but the newest keep finished matches and return the rest.
+
+        Matches still being played are always kept. The dropped matches are
+        returned newest first.
+        """
+        kept = []
+        dropped = []
+        num_finished = 0
+        for match in self:
+            if match.winner is None:
+                kept.append(match)
+            elif num_finished < keep:
+                kept.append(match)
+                num_finished += 1
+            else:
+                dropped.append(match)
+
+        if dropped:
+            self._reset()
+            for match in kept:
+                self.append(match)
+        return dropped
+
+    def active_indexes(self):
+        """Return the positions of the matches still being played."""
+        indexes = [i for i, match in enumerate(self._matches) if match.winner is None]
+        for index in self._active_at_load:
+            if self._unpacked[index].winner is None:
+                indexes.append(len(self._matches) + index)
+        return indexes
+
+    def _find_packed(self, match_id):
+        if self._packed_ids is None:
+            # ids count up from 0 for the oldest match, so look where it
+            # should be before going through every record
+            index = self._num_packed - 1 - match_id
+            if (
+                0 <= index < self._num_packed
+                and MATCH_RECORD.unpack_from(self._packed, index * MATCH_RECORD.size)[0]
+                == match_id
+            ):
+                return index
+            self._packed_ids = {
+                record[0]: index
+                for index, record in enumerate(MATCH_RECORD.iter_unpack(self._packed))
+            }
+        return self._packed_ids.get(match_id)
+
+    def _unpack(self, index):
+        match = self._unpacked.get(index)
+        if match is None:
+            match_id, a, b, machine_id, winner_id, completed_at = (
+                MATCH_RECORD.unpack_from(self._packed, index * MATCH_RECORD.size)
+            )
+            players = self._roster.players
+            match = Match(
+                match_id, players[a], players[b], self._roster.machines[machine_id],
+                winner=players[winner_id] if winner_id >= 0 else None,
+                completed_at=completed_at or None,
+            )
+            self._unpacked[index] = match
+            self._by_id[match_id] = match
+        return match
+
+
 class Tournament:
     def __init__(self):
+        self._roster = Roster()
+
         self._players = {}
-        self._avail_players = []
+        self._player_names = []  # kept sorted
+        self._avail_players = PlayerQueue()
+        self._standings = Standings()
         self._enabled_players = set()
+        self._enabled_players_mask = 0
 
         self._machines = {}
+        self._machine_names = []  # kept sorted
         self._enabled_machines = set()
+        self._enabled_machines_mask = 0
 
-        self._matches = []
+        self._matches = MatchHistory(self._roster)
+        # ids keep counting up even once old matches are archived
+        self._next_match_id = 0
 
         self._sort_by_rank = True
 
+        self._pairing = flipper_frenzy.pairing.GreedyPairing()
+        self._format = flipper_frenzy.formats.RollingFormat()
+
+        # bumped by every mutation. the change log records which players,
+        # machines and matches (or the queue) each version touched
+        self.version = 0
+        self._changes = []  # (kind, key), in version order
+        self._change_versions = []
+        self._changes_start = 0  # the oldest version the log covers
+        self._pending_changes = []
+        # the last version that changed each kind, see last_changed
+        self._kind_versions = {}
+        # the last version that changed each (kind, key), see changed_at
+        self._key_versions = {}
+        self._reset_version = 0
+
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call callback with an event dict after every mutation."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+
+    def _changed(self, kind, *keys):
+        """Note what the current mutation touched, before calling _emit."""
+        for key in keys:
+            self._pending_changes.append((kind, key))
+
+    def _emit(self, event_type, **data):
+        self.version += 1
+        for change in self._pending_changes:
+            self._changes.append(change)
+            self._change_versions.append(self.version)
+            self._kind_versions[change[0]] = self.version
+            self._key_versions[change] = self.version
+        self._pending_changes = []
+        if len(self._changes) > MAX_CHANGES:
+            del self._changes[:MAX_CHANGES // 2]
+            del self._change_versions[:MAX_CHANGES // 2]
+            # the oldest version left may have lost some of its changes
+            self._changes_start = self._change_versions[0]
+
+        if not self._listeners:
+            return
+        event = {"type": event_type, "version": self.version, **data}
+        for callback in self._listeners:
+            callback(event)
+
+    def reset_changes(self, version):
+        """Jump to the given version and start the change log over."""
+        self.version = version
+        self._changes = []
+        self._change_versions = []
+        self._changes_start = version
+        self._kind_versions = {}
+        self._key_versions = {}
+        self._reset_version = version
+
+    def get_changes(self, since):
+        """Return what changed after version since, as {kind: set of keys}.
+
+        Kinds are "player" and "machine" keyed by name, "match" keyed by id,
+        and "queue", "settings" (sorting and pairing) and "result" (any
+        match being completed) keyed by None.
+        Returns None if the change log doesn't go back as far as since.
+        """
+        if since < self._changes_start or since > self.version:
+            return None
+        changes = {
+            "player": set(), "machine": set(), "match": set(), "queue": set(),
+            "settings": set(), "result": set(),
+        }
+        start = bisect.bisect_right(self._change_versions, since)
+        for kind, key in self._changes[start:]:
+            changes[kind].add(key)
+        return changes
+
+    def last_changed(self, *kinds):
+        """Return the last version that changed any of the kinds of get_changes.
+
+        Anything changed before the last reset_changes counts as changed at
+        that version.
+        """
+        return max(self._kind_versions.get(kind, self._reset_version) for kind in kinds)
+
+    def changed_at(self, kind, key):
+        """Return the last version that changed one thing, like ("match", 3).
+
+        Unlike get_changes this never runs out, anything changed before the
+        last reset_changes counts as changed at that version.
+        """
+        return self._key_versions.get((kind, key), self._reset_version)
+
     def sort_by(self, by_rank=True):
         self._sort_by_rank = by_rank
+        self._changed("settings", None)
+        self._emit("sort_by", by_rank=by_rank)
+
+    def set_pairing(self, name):
+        """Choose how matches are picked, see flipper_frenzy.pairing."""
+        strategy = flipper_frenzy.pairing.PAIRING_STRATEGIES.get(name)
+        if strategy is None:
+            return f"Pairing '{name}' doesn't exist!"
+
+        self._pairing = strategy()
+        self._changed("settings", None)
+        self._emit("set_pairing", name=name)
+        return f"Updated pairing to '{name}'"
+
+    def set_format(self, name):
+        """Choose how matches are scheduled, see flipper_frenzy.formats.
+
+        Switching formats starts the new one from scratch.
+        """
+        format_class = flipper_frenzy.formats.FORMATS.get(name)
+        if format_class is None:
+            return f"Format '{name}' doesn't exist!"
+
+        self._format = format_class()
+        self._changed("settings", None)
+        self._emit("set_format", name=name)
+        return f"Updated format to '{name}'"
+
+    def start_round(self, state=None):
+        """Pair everyone up for the format's next round, in a single pass.
+
+        The pairs are put on machines by next_match and fill_matches, which
+        call this once a round is over. Pass the journaled state to replay
+        a round rather than pairing it again. Byes are counted as wins here,
+        if the format does, so replaying counts them too. Returns a message,
+        which says so if the format's event is over.
+        """
+        if not self._format.rounds:
+            return f"The {self._format.name} format doesn't play in rounds!"
+        if state is not None:
+            self._format.restore(state)
+        else:
+            pairs = self._format.pair_round(self)
+            if pairs is None:
+                return self._format.finished_message(self)
+            self._format.begin_round(pairs)
+        if self._format.bye_wins:
+            for name_a, name_b in self._format.pairs:
+                player = self._players.get(name_a)
+                if name_b is None and player is not None:
+                    player.num_wins += 1
+                    player.num_played += 1
+                    player.calc_ratio()
+                    self._standings.update(player)
+                    self._changed("player", name_a)
+                    self._changed("result", None)
+        self._changed("settings", None)
+        self._emit("start_round", state=self._format.serialize())
+        return f"Round {self._format.round} started!"
+
+    def _next_round(self):
+        """Start rounds until one has matches left to play.
+
+        Returns a message if the format's event is over, otherwise None.
+        """
+        while self._format.round_over(self):
+            round_number = self._format.round
+            message = self.start_round()
+            if self._format.round == round_number:
+                return message
+        return None
 
     def add_player(self, name):
         name = name.strip()
+        if len(name) > MAX_NAME_LENGTH:
+            return f"Player names can't be longer than {MAX_NAME_LENGTH} characters!"
         if name in self._players:
             return f"Player '{name}' already exists!"
 
-        player = Player(name, set(self._enabled_machines))
+        player = Player(name, self._roster)
+        self._register_player(player)
+        self._set_machines(player, self._enabled_machines_mask)
 
-        self._players[name] = player
         self._avail_players.append(player)
         self._enabled_players.add(player)
+        self._enabled_players_mask |= player.bit
+        self._changed("player", name)
+        self._changed("queue", None)
+        self._emit("add_player", name=name)
 
         return f"Added new player '{name}'"
 
@@ -162,28 +734,113 @@ class Tournament:
         player.enabled = enable
         if enable:
             self._enabled_players.add(player)
-            if player not in self._avail_players:
+            self._enabled_players_mask |= player.bit
+            # players in a match get re-queued once the match completes
+            if not player.active:
                 self._avail_players.append(player)
         else:
-            if player in self._enabled_players:
-                self._enabled_players.remove(player)
+            self._enabled_players.discard(player)
+            self._enabled_players_mask &= ~player.bit
             if player in self._avail_players:
                 self._avail_players.remove(player)
+        if enable:
+            # everyone else may have been faced while the player was away
+            check_mask = player.bit
+        else:
+            # anyone who only had this player left to face has finished a round
+            check_mask = self._enabled_players_mask & ~player.faced_by_mask
+        for other in iter_bits(check_mask, self._roster.players):
+            if self._end_rounds(other):
+                self._changed("player", other.name)
+        self._standings.update(player)
+        self._changed("player", name)
+        self._changed("queue", None)
+        self._emit("enable_player", name=name, enable=enable)
 
         return f"Updated player '{name}' to {enable}"
 
     def add_machine(self, name, enabled=True):
         """Add a new machine to the tournament."""
         name = name.strip()
+        if len(name) > MAX_NAME_LENGTH:
+            return f"Machine names can't be longer than {MAX_NAME_LENGTH} characters!"
         if name in self._machines:
             return f"Machine '{name}' already exists!"
 
         machine = Machine(name, enabled)
+        self._roster.add_machine(machine)
         self._machines[name] = machine
-        self._enabled_machines.add(machine)
+        bisect.insort(self._machine_names, name)
+        if enabled:
+            self._enabled_machines.add(machine)
+            self._enabled_machines_mask |= machine.bit
 
         for player in self._players.values():
-            player.machines.add(machine)
+            self._add_machine(player, machine)
+        self._changed("machine", name)
+        self._changed("player", *self._players)
+        self._emit("add_machine", name=name, enabled=enabled)
+
+    def add_players(self, names):
+        """Add many players at once, skipping duplicates, empty names and
+        names longer than MAX_NAME_LENGTH.
+
+        Does the same as calling add_player for each name, but as a single
+        mutation.
+        """
+        added = []
+        for name in names:
+            name = name.strip()
+            if not name or len(name) > MAX_NAME_LENGTH or name in self._players:
+                continue
+            player = Player(name, self._roster)
+            self._register_player(player)
+            self._set_machines(player, self._enabled_machines_mask)
+            self._avail_players.append(player)
+            self._enabled_players.add(player)
+            self._enabled_players_mask |= player.bit
+            added.append(name)
+
+        if added:
+            self._changed("player", *added)
+            self._changed("queue", None)
+            self._emit("add_players", names=added)
+        return f"Added {len(added)} new players"
+
+    def add_machines(self, names, enabled=True):
+        """Add many machines at once, skipping duplicates, empty names and
+        names longer than MAX_NAME_LENGTH.
+        """
+        added_mask = 0
+        added = []
+        for name in names:
+            name = name.strip()
+            if not name or len(name) > MAX_NAME_LENGTH or name in self._machines:
+                continue
+            machine = Machine(name, enabled)
+            self._roster.add_machine(machine)
+            self._machines[name] = machine
+            bisect.insort(self._machine_names, name)
+            if enabled:
+                self._enabled_machines.add(machine)
+                self._enabled_machines_mask |= machine.bit
+            added_mask |= machine.bit
+            added.append(name)
+
+        if not added:
+            return "Added 0 new machines"
+
+        # every player still has to play the new machines
+        all_players_mask = (1 << len(self._roster.players)) - 1
+        for machine in iter_bits(added_mask, self._roster.machines):
+            machine.players_mask = all_players_mask
+        for player in self._players.values():
+            player.machines_mask |= added_mask
+
+        self._changed("machine", *added)
+        self._changed("player", *self._players)
+        self._emit("add_machines", names=added, enabled=enabled)
+        return f"Added {len(added)} new machines"
 
     def enable_machine(self, name, enable):
         name = name.strip()
@@ -194,8 +851,16 @@ class Tournament:
         machine.enabled = enable
         if enable:
             self._enabled_machines.add(machine)
+            self._enabled_machines_mask |= machine.bit
         else:
-            self._enabled_machines.remove(machine)
+            self._enabled_machines.discard(machine)
+            self._enabled_machines_mask &= ~machine.bit
+            # players who only had this machine left have finished a round
+            for player in iter_bits(machine.players_mask, self._roster.players):
+                if self._end_rounds(player):
+                    self._changed("player", player.name)
+        self._changed("machine", name)
+        self._emit("enable_machine", name=name, enable=enable)
 
     def add_machine_to_player(self, player_name, machine_name):
         machine_name = machine_name.strip()
@@ -208,11 +873,26 @@ class Tournament:
         if player is None:
             return f"Player '{player_name}' doesn't exist!"
 
-        player.machines.add(machine)
+        self._add_machine(player, machine)
+        self._changed("player", player_name)
+        self._emit(
+            "add_machine_to_player", player=player_name, machine=machine_name
+        )
 
     def shuffle(self):
-        random.shuffle(self._avail_players)
+        player_names = [p.name for p in self._avail_players]
+        random.shuffle(player_names)
+        self.set_queue(player_names)
+
+    def set_queue(self, player_names):
+        """Put the available players queue in the given order."""
+        self._avail_players.set_order(
+            self._players[name] for name in player_names
+        )
+        self._changed("queue", None)
+        self._emit("shuffle", order=player_names)
 
+    @flipper_frenzy.metrics.timed("next_match_seconds")
     def next_match(self, check_machines=True):
         """Determine the next match, consisting of two players and a machine.
 
@@ -220,55 +900,22 @@ class Tournament:
         number of matches since players earlier in the queue might have
         been waiting longer.
         """
-        if len(self._avail_players) < 2:
-            return "Unable to find another match! Not enough available players."
+        return self._next_match(check_machines)
 
-        # check each player in the queue
-        for player_a, player_b in itertools.combinations(self._avail_players, 2):
-            if not player_a.enabled:
-                self._avail_players.remove(player_a)
-                continue
-
-            if not player_b.enabled:
-                self._avail_players.remove(player_b)
-                continue
-
-            # check if players have already played one another
-            if player_b in player_a.opponents:
-                continue
+    def _next_match(self, check_machines):
+        if self._format.rounds:
+            finished = self._next_round()
+            if finished is not None:
+                return finished
 
-            if player_a in player_b.opponents:
-                continue
-
-            # check if the players have a machine in common
-            if check_machines:
-                common_machines = player_a.machines.intersection(player_b.machines)
-            else:
-                common_machines = player_a.machines
-            if not common_machines:
-                continue
+        if len(self._avail_players) < 2:
+            flipper_frenzy.metrics.count("next_match_failures_total")
+            return "Unable to find another match! Not enough available players."
 
-            for machine in common_machines:
-                if machine.active:
-                    continue
-                if not machine.enabled:
-                    player_a.machines.remove(machine)
-                    if machine in player_b.machines:
-                        player_b.machines.remove(machine)
-                    continue
-
-                match_id = len(self._matches)
-                match = Match(match_id, player_a, player_b, machine)
-                self._matches.insert(0, match)
-
-                self._avail_players.remove(player_a)
-                self._avail_players.remove(player_b)
-                player_a.machines.remove(machine)
-                if machine in player_b.machines:
-                    player_b.machines.remove(machine)
-                player_a.opponents.add(player_b)
-                player_b.opponents.add(player_a)
-                return str(match)
+        found = self._format.find_matches(self, check_machines=check_machines, limit=1)
+        if found:
+            match = self.start_match(*found[0])
+            return str(match)
 
         # if we checked all possible combos but couldn't find a match and all
         # enabled players are in the queue, then it's possible we're stuck
@@ -276,32 +923,187 @@ class Tournament:
         # so if the number of available players is equal to the number of enabled
         # players, then try finding a match again, using only player a's
         # unplayed machines.
-        if check_machines and set(self._avail_players) == self._enabled_players:
-            return self.next_match(check_machines=False)
-
+        # (the queue only ever holds enabled players, so comparing sizes is enough)
+        # rounds don't need unplayed machines, so they never get stuck on them
+        if (
+            check_machines and not self._format.rounds
+            and len(self._avail_players) == len(self._enabled_players)
+        ):
+            flipper_frenzy.metrics.count("next_match_fallbacks_total")
+            return self._next_match(check_machines=False)
+
+        flipper_frenzy.metrics.count("next_match_failures_total")
         return "Unable to find another match! No valid match-ups found."
 
-    def complete_match(self, match_id, winner_name):
-        match = self._matches[match_id]
-        winner = self._players[winner_name]
+    def fill_matches(self):
+        """Start a match on every free machine that can be filled.
+
+        Uses the same rules and queue priority as calling next_match once per
+        free machine, but finds all the matches in one pass.
+        """
+        if self._format.rounds:
+            finished = self._next_round()
+            if finished is not None:
+                return finished
+
+        if len(self._avail_players) < 2:
+            return "Unable to find another match! Not enough available players."
+
+        matches = []
+        found = self._format.find_matches(self)
+        if (
+            not found and not self._format.rounds
+            and len(self._avail_players) == len(self._enabled_players)
+        ):
+            # same fallback as next_match when every player is waiting
+            flipper_frenzy.metrics.count("next_match_fallbacks_total")
+            relaxed = self._format.find_matches(self, check_machines=False, limit=1)
+            for players_and_machine in relaxed:
+                matches.append(self.start_match(*players_and_machine))
+            found = self._format.find_matches(self)
+
+        for players_and_machine in found:
+            matches.append(self.start_match(*players_and_machine))
+
+        if not matches:
+            return "Unable to find another match! No valid match-ups found."
+        return "Started matches: " + ", ".join(str(match) for match in matches)
+
+    def start_match(self, player_a, player_b, machine, match_id=None):
+        """Put two players on a machine, without checking the match is valid."""
+        if match_id is None:
+            match_id = self._next_match_id
+        self._next_match_id = max(self._next_match_id, match_id + 1)
+        match = Match(match_id, player_a, player_b, machine)
+        self._matches.add(match)
+
+        self._avail_players.remove(player_a)
+        self._avail_players.remove(player_b)
+        self._remove_machine(player_a, machine)
+        self._remove_machine(player_b, machine)
+        self._add_opponent(player_a, player_b)
+        self._add_opponent(player_b, player_a)
+        self._format.match_started(player_a, player_b)
+
+        self._changed("match", match_id)
+        self._changed("player", player_a.name, player_b.name)
+        self._changed("machine", machine.name)
+        self._changed("queue", None)
+        self._emit(
+            "next_match", id=match_id, player_a=player_a.name,
+            player_b=player_b.name, machine=machine.name,
+        )
+        return match
+
+    @flipper_frenzy.metrics.timed("complete_match_seconds")
+    def complete_match(self, match_id, winner_name, completed_at=None):
+        """Record the winner of a match that's being played.
+
+        A match can only be won once, so a second report of the same result,
+        e.g. from another scorer, changes nothing.
+        """
+        match = self._matches.find(match_id)
+        if match is None:
+            if 0 <= match_id < self._next_match_id:
+                # archived, which only happens to finished matches
+                return f"Match {match_id} is already finished!"
+            return f"Match {match_id} doesn't exist!"
+        winner = self._players.get(winner_name)
+        if winner is not match.player_a and winner is not match.player_b:
+            return f"'{winner_name}' isn't playing in match {match_id}!"
+        if match.winner is not None:
+            if match.winner is winner:
+                return "Match finished!"
+            return f"Match {match_id} was already won by '{match.winner.name}'!"
+
         match.set_winner(winner)
+        self._format.match_completed(match)
+        match.completed_at = completed_at if completed_at is not None else time.time()
+        self._standings.update(match.player_a)
+        self._standings.update(match.player_b)
+
+        # re-add the two players to the queue, unless they were disabled
+        # while they were playing
+        for player in (match.player_a, match.player_b):
+            if player.enabled:
+                self._avail_players.append(player)
+
+        for player in (match.player_a, match.player_b):
+            self._end_rounds(player)
 
-        # re-add the two players to the queue
-        self._avail_players.append(match.player_a)
-        self._avail_players.append(match.player_b)
+        self._changed("match", match_id)
+        self._changed("player", match.player_a.name, match.player_b.name)
+        self._changed("machine", match.machine.name)
+        self._changed("queue", None)
+        self._changed("result", None)
+        self._emit(
+            "complete_match", id=match_id, winner=winner_name, time=match.completed_at,
+        )
+        return "Match finished!"
 
-        # if the players have faced all other opponents,
-        # then reset their opponents lists
-        if self._enabled_players.difference(match.player_a.opponents) == {match.player_a}:
-            match.player_a.opponents = set()
-        if self._enabled_players.difference(match.player_b.opponents) == {match.player_b}:
-            match.player_b.opponents = set()
+    def prune_matches(self, keep):
+        """Drop all but the newest keep finished matches from memory.
 
-        # if the players have played all machines then reset their machines
-        if not any(machine.enabled for machine in match.player_a.machines):
-            match.player_a.machines = self._enabled_machines
-        if not any(machine.enabled for machine in match.player_b.machines):
-            match.player_b.machines = self._enabled_machines
+        Returns the dropped matches, newest first, for the caller to archive.
+        This doesn't count as a mutation since the matches aren't changed.
+        """
+        dropped = self._matches.prune(keep)
+        for match in dropped:
+            self._key_versions.pop(("match", match.id), None)
+        return dropped
+
+    def _register_player(self, player):
+        self._roster.add_player(player)
+        self._players[player.name] = player
+        bisect.insort(self._player_names, player.name)
+        self._standings.add(player)
+
+    # the helpers below keep the players' and machines' bitsets in sync
+
+    def _add_machine(self, player, machine):
+        player.machines_mask |= machine.bit
+        machine.players_mask |= player.bit
+
+    def _remove_machine(self, player, machine):
+        player.machines_mask &= ~machine.bit
+        machine.players_mask &= ~player.bit
+
+    def _set_machines(self, player, machines_mask):
+        for machine in iter_bits(player.machines_mask, self._roster.machines):
+            machine.players_mask &= ~player.bit
+        player.machines_mask = machines_mask
+        for machine in iter_bits(machines_mask, self._roster.machines):
+            machine.players_mask |= player.bit
+
+    def _add_opponent(self, player, opponent):
+        player.opponents_mask |= opponent.bit
+        opponent.faced_by_mask |= player.bit
+
+    def _end_rounds(self, player):
+        """Start the player's next round if they've faced every enabled player
+        or played every enabled machine, and return whether either happened.
+
+        Only cheap bitset checks unless a round is over.
+        """
+        ended = False
+        if player.opponents_mask and not (
+            self._enabled_players_mask & ~player.opponents_mask & ~player.bit
+        ):
+            self._clear_opponents(player)
+            player.rounds += 1
+            ended = True
+        if self._enabled_machines_mask and not (
+            player.machines_mask & self._enabled_machines_mask
+        ):
+            self._set_machines(player, self._enabled_machines_mask)
+            player.machine_rounds += 1
+            ended = True
+        return ended
+
+    def _clear_opponents(self, player):
+        for opponent in iter_bits(player.opponents_mask, self._roster.players):
+            opponent.faced_by_mask &= ~player.bit
+        player.opponents_mask = 0
 
     def print_state(self):
         print("Active Matches:")
@@ -325,43 +1127,35 @@ class Tournament:
         player = self._players[player_name]
 
         # get opponent data
-        players = list(self._players.values())
-        players.sort(key=lambda p: p.name)
         opponents = []
-        for opponent in players:
+        for opponent_name in self._player_names:
+            opponent = self._players[opponent_name]
             if opponent == player or not opponent.enabled:
                 continue
 
-            faced = opponent in player.opponents
-            opponent = opponent.serialize()
-            opponent["faced"] = faced
-            opponents.append(opponent)
+            opponents.append({
+                "name": opponent.name,
+                "enabled": opponent.enabled,
+                "faced": bool(player.opponents_mask & opponent.bit),
+            })
 
         # get played machines list
-        machines = list(self._machines.values())
-        machines.sort(key=lambda m: m.name)
         played_machines = []
-        for machine in machines:
+        for machine_name in self._machine_names:
+            machine = self._machines[machine_name]
             if not machine.enabled:
                 continue
 
-            played = machine not in player.machines
+            played = not player.machines_mask & machine.bit
             machine = machine.serialize()
             machine["played"] = played
             played_machines.append(machine)
 
         # get played matches
-        matches = []
-        for match in self._matches:
-            if match.player_a != player and match.player_b != player:
-                continue
-            won = match.winner == player
-            swap = match.player_a != player
-            match = match.serialize()
-            match["won"] = won
-            if swap:
-                match["player_a"], match["player_b"] = match["player_b"], match["player_a"]
-            matches.append(match)
+        matches = [
+            player_match_data(match.serialize(), player.name)
+            for match in self._matches.for_player(player)
+        ]
 
         return {
             "player": player.serialize(),
@@ -370,33 +1164,94 @@ class Tournament:
             "matches": matches,
         }
 
-    def serialize(self):
-        # sort the players
-        players = list(self._players.values())
+    def get_standings(self, top=None):
+        """Return the serialized players in ranking order, with their rank.
+
+        If top is given only the first top players are returned.
+        """
+        players = self._standings.top(top) if top is not None else self._standings
+        standings = []
+        for rank, player in enumerate(players, 1):
+            player_data = player.serialize()
+            player_data["rank"] = rank
+            standings.append(player_data)
+        return standings
+
+    def get_rank(self, player_name):
+        """Return the player's 1-based rank, or None if they don't exist."""
+        player = self._players.get(player_name)
+        if player is None:
+            return None
+        return self._standings.rank(player)
+
+    def sorted_players(self):
+        """Return the players by rank, or in queue order if sorting by queue."""
         if self._sort_by_rank:
-            players.sort(key=lambda p: (-p.enabled, -p.ratio, p.num_played, p.name))
-        else:
-            len_avail_players = len(self._avail_players)
-            players.sort(key=lambda p: (
-                self._avail_players.index(p) if p in self._avail_players else len_avail_players,
-                -p.enabled,
-                p.name
-            ))
-
-        # sort the machines
+            return list(self._standings)
+        players = list(self._players.values())
+        not_queued = float("inf")
+        players.sort(key=lambda p: (
+            self._avail_players.order_key(p, not_queued),
+            -p.enabled,
+            p.name
+        ))
+        return players
+
+    def sorted_machines(self):
+        """Return the machines, free ones first."""
         machines = list(self._machines.values())
         machines.sort(key=lambda m: (-m.enabled, m.active, m.name))
+        return machines
 
+    @flipper_frenzy.metrics.timed("serialize_seconds")
+    def serialize(self):
         return {
-            "machines": [machine.serialize() for machine in machines],
+            "machines": [machine.serialize() for machine in self.sorted_machines()],
             "avail_players": [player.name for player in self._avail_players],
-            "players": [player.serialize() for player in players],
+            "players": [player.serialize() for player in self.sorted_players()],
             "matches": [match.serialize() for match in self._matches],
             "sort_by_rank": self._sort_by_rank,
+            "pairing": self._pairing.name,
+            "format": self._format.name,
+            "format_state": self._format.serialize(),
+            "next_match_id": self._next_match_id,
+            "version": self.version,
         }
 
+    def serialize_changes(self, since):
+        """Serialize only what changed after version since, or return None.
+
+        See get_changes. The queue is only included if it changed.
+        """
+        changes = self.get_changes(since)
+        if changes is None:
+            return None
+
+        data = {
+            "machines": [
+                self._machines[name].serialize() for name in sorted(changes["machine"])
+            ],
+            "players": [
+                self._players[name].serialize() for name in sorted(changes["player"])
+            ],
+            # matches archived since they changed are left out
+            "matches": [
+                match.serialize()
+                for match in map(self._matches.find, sorted(changes["match"], reverse=True))
+                if match is not None
+            ],
+            "version": self.version,
+        }
+        if changes["queue"]:
+            data["avail_players"] = [p.name for p in self._avail_players]
+        return data
+
+    @flipper_frenzy.metrics.timed("restore_seconds")
     def restore(self, data):
         self.sort_by(data["sort_by_rank"])
+        self.set_pairing(data.get("pairing", "greedy"))
+        self.set_format(data.get("format", "rolling"))
+        self._format.restore(data.get("format_state", {}))
 
         # restore machine objects
         for machine_data in data["machines"]:
@@ -407,28 +1262,33 @@ class Tournament:
         # restore player objects
         for player_data in data.get("players", []):
             player = Player(
-                player_data["name"], set(),
+                player_data["name"], self._roster,
                 num_wins=player_data["num_wins"],
                 num_losses=player_data["num_losses"],
                 num_played=player_data["num_played"],
                 enabled=player_data["enabled"],
+                rounds=player_data.get("rounds", 0),
+                machine_rounds=player_data.get("machine_rounds", 0),
             )
-            self._players[player.name] = player
+            self._register_player(player)
             if player_data["enabled"]:
                 self._enabled_players.add(player)
+                self._enabled_players_mask |= player.bit
 
             for opponent_name in player_data["opponents"]:
                 opponent = self._players.get(opponent_name)
                 if opponent is not None:
-                    player.opponents.add(opponent)
-                    opponent.opponents.add(player)
+                    self._add_opponent(player, opponent)
+                    self._add_opponent(opponent, player)
 
             for machine_id in player_data["machines"]:
-                player.machines.add(self._machines[machine_id])
+                self._add_machine(player, self._machines[machine_id])
 
         # rebuild available players queue
         for player_name in data.get("avail_players", []):
-            self._avail_players.append(self._players[player_name])
+            player = self._players[player_name]
+            if player.enabled:
+                self._avail_players.append(player)
 
         # restore matches. if winner is not None, it will reset the active flags
         for match_id, match_data in enumerate(data.get("matches", [])):
@@ -437,8 +1297,19 @@ class Tournament:
             machine = self._machines[match_data["machine_name"]]
             winner_name = match_data["winner"]
             winner = self._players.get(winner_name)
-            match = Match(match_id, player_a, player_b, machine, winner=winner)
+            match_id = match_data.get("id", match_id)
+            match = Match(
+                match_id, player_a, player_b, machine, winner=winner,
+                completed_at=match_data.get("completed_at"),
+            )
             self._matches.append(match)
+            self._next_match_id = max(self._next_match_id, match_id + 1)
+        self._next_match_id = max(
+            self._next_match_id, data.get("next_match_id", 0)
+        )
+
+        # versions carry on from the saved data, changes before it are unknown
+        self.reset_changes(data.get("version", 0))
 
 
 # Press the green button in the gutter to run the script.
@@ -0,0 +1,154 @@
+"""Counters and timings for the hot paths, in Prometheus text format.
+
+Everything is kept in this process, so with several shards each one has to
+be scraped on its own.
+"""
+import bisect
+import contextlib
+import functools
+import threading
+import time
+
+PREFIX = "flipper_frenzy_"
+
+# upper bounds of the timing histograms' buckets, in seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+HELP = {
+    "restore_seconds": ("histogram", "Time spent in Tournament.restore"),
+    "serialize_seconds": ("histogram", "Time spent in Tournament.serialize"),
+    "next_match_seconds": ("histogram", "Time spent in Tournament.next_match"),
+    "complete_match_seconds": ("histogram", "Time spent in Tournament.complete_match"),
+    "render_seconds": ("histogram", "Time spent rendering templates"),
+    "render_cache_hits_total": ("counter", "Pages and fragments served from the render cache"),
+    "render_cache_misses_total": ("counter", "Pages and fragments that had to be rendered"),
+    "next_match_failures_total": ("counter", "next_match calls that found no match"),
+    "next_match_fallbacks_total": (
+        "counter", "next_match calls that retried without checking machines",
+    ),
+    "pairing_candidate_pairs_total": (
+        "counter", "Pairs of players examined while looking for matches",
+    ),
+    "stale_writes_total": (
+        "counter", "Commands rejected because what they change changed first",
+    ),
+    "tournaments_loaded": ("gauge", "Tournaments resident in this process"),
+    "event_subscribers": ("gauge", "Clients subscribed to tournament events"),
+}
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def count(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorate a function to record how long each call takes."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels, **extra):
+    labels = list(labels) + list(extra.items())
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def render(gauges=None):
+    """Return every metric in the Prometheus text exposition format.
+
+    gauges maps gauge names to their current values, which the caller
+    reads at scrape time.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {
+            key: (list(h.counts), h.count, h.sum) for key, h in _histograms.items()
+        }
+
+    families = {}
+    for name, labels in list(counters) + list(histograms):
+        families.setdefault(name, [])
+    for name in gauges or {}:
+        families.setdefault(name, [])
+
+    lines = []
+    for name in sorted(families):
+        metric_type, help_text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+        if gauges and name in gauges:
+            lines.append(f"{PREFIX}{name} {gauges[name]}")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        for (histogram_name, labels), (counts, total, seconds) in sorted(histograms.items()):
+            if histogram_name != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{PREFIX}{name}_bucket{_format_labels(labels, le=bound)} {cumulative}"
+                )
+            lines.append(
+                f"{PREFIX}{name}_bucket{_format_labels(labels, le='+Inf')} {total}"
+            )
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {seconds}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {total}")
+    return "\n".join(lines) + "\n"
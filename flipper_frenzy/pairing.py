@@ -0,0 +1,215 @@
+import flipper_frenzy.metrics
+
+
+def _count_bits(mask):
+    return bin(mask).count("1")
+
+
+class GreedyPairing:
+    """Pair the earliest players in the queue that can still play each other.
+
+    Rather than checking every pair of players, this works off the bitsets
+    the tournament maintains: each player's opponents (and the players that
+    count them as an opponent) and, for each machine, the players that still
+    need to play it. For each player in queue order the valid opponents are
+    found with a few integer operations, so the queue is only walked again
+    once a match is known to exist.
+    """
+
+    name = "greedy"
+
+    def find_match(self, t, check_machines=True):
+        """Return (player_a, player_b, machine) for the next match, or None.
+
+        With check_machines=False the machine only has to be one player a
+        hasn't played yet, rather than one neither player has played.
+        """
+        found = self.find_matches(t, check_machines=check_machines, limit=1)
+        return found[0] if found else None
+
+    def find_matches(self, t, check_machines=True, limit=None):
+        """Return the matches to put on as many free machines as possible.
+
+        This gives the same matches as calling find_match over and over, but
+        in a single pass over the queue: a player that had no valid opponent
+        won't have one once other players and machines are taken either.
+        """
+        free_machines = [
+            m for m in t._machines.values() if m.enabled and not m.active
+        ]
+        queue = [p for p in t._avail_players if p.enabled]
+        remaining = 0
+        for player in queue:
+            remaining |= player.bit
+
+        found = []
+        num_pairs = 0
+        for i, player_a in enumerate(queue):
+            if not free_machines or len(found) == limit:
+                break
+
+            # skip players already matched up as a player b, otherwise only
+            # players later in the queue are candidates for player b
+            if not remaining & player_a.bit:
+                continue
+            remaining &= ~player_a.bit
+            # the masks below check player a against everyone behind them
+            num_pairs += len(queue) - i - 1
+            candidates = (
+                remaining & ~player_a.opponents_mask & ~player_a.faced_by_mask
+            )
+            if not candidates:
+                continue
+
+            a_machines = [m for m in free_machines if m.players_mask & player_a.bit]
+            if not a_machines:
+                continue
+
+            if check_machines:
+                shared = 0
+                for machine in a_machines:
+                    shared |= machine.players_mask
+                candidates &= shared
+                if not candidates:
+                    continue
+
+            for player_b in queue[i + 1:]:
+                if candidates & player_b.bit:
+                    break
+            remaining &= ~player_b.bit
+
+            if check_machines:
+                a_machines = [m for m in a_machines if m.players_mask & player_b.bit]
+            # of the machines both could play, take the one the fewest
+            # waiting players still need so the others aren't left stuck
+            machine = min(
+                a_machines, key=lambda m: _count_bits(m.players_mask & remaining)
+            )
+            free_machines.remove(machine)
+            found.append((player_a, player_b, machine))
+
+        flipper_frenzy.metrics.count(
+            "pairing_candidate_pairs_total", num_pairs, strategy=self.name
+        )
+        return found
+
+
+class MatchingPairing:
+    """Fill as many free machines as possible, then favour waiting players.
+
+    Every free machine can take at most one pair of players, so choosing the
+    matches is a matching problem between players and machines. This solves
+    it with a depth-first branch and bound over the free machines, starting
+    from the greedy matches so it never does worse than them. A plan is
+    better if it starts more matches, and on a tie if the players it picks
+    have been waiting longer, where a player's weight is the number of
+    players queued behind them.
+
+    To keep every request fast the search only looks at the first
+    max_candidates waiting players for each machine and gives up after
+    max_nodes steps, returning the best plan found so far.
+    """
+
+    name = "matching"
+
+    def __init__(self, max_nodes=20000, max_candidates=8):
+        self.max_nodes = max_nodes
+        self.max_candidates = max_candidates
+        self._greedy = GreedyPairing()
+
+    def find_match(self, t, check_machines=True):
+        found = self.find_matches(t, check_machines=check_machines, limit=1)
+        return found[0] if found else None
+
+    def find_matches(self, t, check_machines=True, limit=None):
+        # the relaxed fallback only ever starts a single match, and it only
+        # happens when nothing else fits, so there's nothing to optimise
+        if not check_machines:
+            return self._greedy.find_matches(t, check_machines=False, limit=limit)
+
+        queue = [p for p in t._avail_players if p.enabled]
+        weights = {p: len(queue) - i for i, p in enumerate(queue)}
+
+        # the players that could use each machine, in queue order. the most
+        # constrained machines are searched first so dead ends show up early
+        machines = []
+        for machine in t._machines.values():
+            if not machine.enabled or machine.active:
+                continue
+            players = [p for p in queue if machine.players_mask & p.bit]
+            if len(players) >= 2:
+                machines.append((machine, players))
+        machines.sort(key=lambda item: len(item[1]))
+
+        greedy = self._greedy.find_matches(t)
+        best = [
+            len(greedy),
+            sum(weights[a] + weights[b] for a, b, _ in greedy),
+            greedy,
+        ]
+        num_nodes = 0
+        num_pairs = 0
+
+        def weight_bound(used, num_players):
+            # the most weight num_players more players could possibly add
+            total = 0
+            for player in queue:
+                if num_players == 0:
+                    break
+                if not used & player.bit:
+                    total += weights[player]
+                    num_players -= 1
+            return total
+
+        def search(i, used, num_matches, weight, plan):
+            nonlocal num_nodes, num_pairs
+            num_nodes += 1
+            if (num_matches, weight) > (best[0], best[1]):
+                best[:] = [num_matches, weight, list(plan)]
+            if i == len(machines) or num_nodes > self.max_nodes:
+                return
+
+            num_unused = len(queue) - _count_bits(used)
+            max_more = min(len(machines) - i, num_unused // 2)
+            if num_matches + max_more < best[0]:
+                return
+            if (
+                num_matches + max_more == best[0]
+                and weight + weight_bound(used, max_more * 2) <= best[1]
+            ):
+                return
+
+            machine, players = machines[i]
+            candidates = [p for p in players if not used & p.bit]
+            candidates = candidates[:self.max_candidates]
+            for j, player_a in enumerate(candidates):
+                blocked = player_a.opponents_mask | player_a.faced_by_mask
+                for player_b in candidates[j + 1:]:
+                    num_pairs += 1
+                    if blocked & player_b.bit:
+                        continue
+                    plan.append((player_a, player_b, machine))
+                    search(
+                        i + 1, used | player_a.bit | player_b.bit,
+                        num_matches + 1,
+                        weight + weights[player_a] + weights[player_b], plan,
+                    )
+                    plan.pop()
+
+            # or leave this machine idle
+            search(i + 1, used, num_matches, weight, plan)
+
+        search(0, 0, 0, 0, [])
+        flipper_frenzy.metrics.count(
+            "pairing_candidate_pairs_total", num_pairs, strategy=self.name
+        )
+
+        # hand the matches back with the longest waiting players first
+        found = sorted(best[2], key=lambda match: -weights[match[0]])
+        return found[:limit]
+
+
+PAIRING_STRATEGIES = {
+    GreedyPairing.name: GreedyPairing,
+    MatchingPairing.name: MatchingPairing,
+}
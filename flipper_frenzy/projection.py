@@ -0,0 +1,228 @@
+"""Project where everyone will finish by playing out the rest of the event.
+
+In the rolling and round robin formats who plays whom never depends on
+who wins, only on the order matches end in (the other formats aren't
+projected). So each schedule of the matches still to come is made once,
+with the tournament's own fill_matches and complete_match on a copy of
+it, and is then replayed thousands of times at once with NumPy, drawing
+every match's winner from the players' win rates. The schedules, each
+finishing matches in a different random order, are played out in a
+process pool. How many there are is fixed, so the projection doesn't
+depend on how many processes the pool has.
+"""
+import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+import numpy
+
+import flipper_frenzy.snapshot
+
+DEFAULT_RUNS = 2000
+MAX_RUNS = 20000
+# how many processes simulate at once
+WORKERS = int(os.environ.get("FLIPPER_FRENZY_PROJECTION_WORKERS", os.cpu_count() or 1))
+# how many schedules the runs are shared between, each simulated by one task
+SCHEDULES = 16
+# seconds to wait for the simulations before giving up
+TIMEOUT = 60
+
+_pool = None
+_pool_lock = threading.Lock()
+# tournament id -> (what the projection was made from, projection), see
+# project
+_cache = {}
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # not forked, a fork of a threaded server can inherit a lock
+            # another thread holds (e.g. the metrics one) and hang for good
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                WORKERS, mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+
+def reset_pool(pool):
+    """Drop a pool that broke, e.g. when a process was killed.
+
+    A broken pool refuses any more work, so the next projection starts a
+    new one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(*args):
+    """Run a function in the pool, starting a new pool if it broke."""
+    pool = get_pool()
+    try:
+        return pool.submit(*args)
+    except concurrent.futures.process.BrokenProcessPool:
+        reset_pool(pool)
+        return get_pool().submit(*args)
+
+
+def win_rates(wins, played):
+    """Each player's chance of winning a match against an average player.
+
+    Like Player.ratio, but pulled towards a half for players who haven't
+    played much, so nobody is certain to win or lose.
+    """
+    return (wins + 1) / (played + 2)
+
+
+def make_schedule(t, num_matches, rng):
+    """Play num_matches more matches on t and return who played in each.
+
+    Matches being played already count towards num_matches. Each match is
+    a pair of roster ids. Stops early if nobody is left who can play.
+    """
+    active = [match for match in t._matches if match.winner is None]
+    schedule = [(match.player_a.id, match.player_b.id) for match in active]
+    while len(schedule) < num_matches:
+        next_id = t._next_match_id
+        t.fill_matches()
+        for match_id in range(next_id, t._next_match_id):
+            match = t._matches.get(match_id)
+            active.append(match)
+            schedule.append((match.player_a.id, match.player_b.id))
+        if not active:
+            break
+        # the winner makes no difference to who plays next
+        match = active.pop(rng.randrange(len(active)))
+        t.complete_match(match.id, match.player_a.name)
+    return schedule[:num_matches]
+
+
+def simulate(blob, num_matches, num_runs, seed):
+    """Count how often each player finishes in each position.
+
+    blob is a snapshot of the tournament. Returns a players by positions
+    array of counts over num_runs runs, with players in roster order.
+    """
+    rng = numpy.random.default_rng(seed)
+    t = flipper_frenzy.snapshot.loads(blob)
+    players = t._roster.players
+    num_players = len(players)
+    wins = numpy.array([player.num_wins for player in players])
+    played = numpy.array([player.num_played for player in players])
+    enabled = numpy.array([player.enabled for player in players])
+    name_order = numpy.argsort(numpy.argsort([player.name for player in players]))
+    rates = win_rates(wins, played)
+
+    schedule = numpy.array(
+        make_schedule(t, num_matches, random.Random(seed)), dtype=numpy.intp,
+    ).reshape(-1, 2)
+    player_a, player_b = schedule[:, 0], schedule[:, 1]
+
+    # every run plays the same matches, only the winners differ
+    p_a = rates[player_a] / (rates[player_a] + rates[player_b])
+    a_won = rng.random((num_runs, len(schedule))) < p_a
+    winners = numpy.where(a_won, player_a, player_b)
+    runs = numpy.arange(num_runs)[:, None]
+    final_wins = wins + numpy.bincount(
+        (runs * num_players + winners).ravel(), minlength=num_runs * num_players,
+    ).reshape(num_runs, num_players)
+    final_played = (
+        played + numpy.bincount(schedule.ravel(), minlength=num_players)
+    )
+    ratios = numpy.round(
+        numpy.divide(
+            final_wins, final_played, out=numpy.zeros(final_wins.shape),
+            where=final_played > 0,
+        ),
+        2,
+    )
+
+    # the same order as Standings.rank_key, for every run at once
+    shape = (num_runs, num_players)
+    order = numpy.lexsort((
+        numpy.broadcast_to(name_order, shape),
+        numpy.broadcast_to(final_played, shape),
+        -ratios,
+        numpy.broadcast_to(-enabled.astype(int), shape),
+    ))
+    positions = numpy.broadcast_to(numpy.arange(num_players), shape)
+    return numpy.bincount(
+        (order * num_players + positions).ravel(), minlength=num_players * num_players,
+    ).reshape(num_players, num_players)
+
+
+def project(tournament_id, t, num_runs=DEFAULT_RUNS, num_matches=None):
+    """Start projecting each player's chance of finishing in each position.
+
+    num_matches is how many more matches to play, by default about two
+    for every player still playing. Call inside checkout. Only the
+    snapshot is taken there, so this returns a function that waits for
+    the simulations and returns the projection, to call after letting go
+    of the tournament. It raises concurrent.futures.TimeoutError if they
+    take over TIMEOUT seconds, and BrokenProcessPool if the pool broke
+    while they ran, after dropping it. Projections are kept until the next result,
+    until players join or leave, or until the pairing or format changes.
+    """
+    if num_matches is None:
+        num_matches = len(t._enabled_players)
+    num_matches = max(num_matches, 0)
+    num_runs = max(1, min(num_runs, MAX_RUNS))
+    version = t.last_changed("result", "settings")
+    key = version, t._enabled_players_mask, num_runs, num_matches
+    cached = _cache.get(tournament_id)
+    if cached is not None and cached[0] == key:
+        return lambda: cached[1]
+
+    blob = flipper_frenzy.snapshot.dumps(t)
+    standings = [player.id for player in t._standings]
+    names = [player.name for player in t._roster.players]
+
+    num_schedules = min(SCHEDULES, num_runs)
+    futures = [
+        submit(
+            simulate, blob, num_matches,
+            num_runs // num_schedules + (i < num_runs % num_schedules),
+            version * num_schedules + i,
+        )
+        for i in range(num_schedules)
+    ]
+    pool = get_pool()
+
+    def wait():
+        deadline = time.monotonic() + TIMEOUT
+        try:
+            counts = sum(
+                future.result(timeout=max(deadline - time.monotonic(), 0))
+                for future in futures
+            )
+        except concurrent.futures.process.BrokenProcessPool:
+            reset_pool(pool)
+            raise
+        projection = {
+            "version": version,
+            "runs": num_runs,
+            "matches": num_matches,
+            "players": [
+                {
+                    "name": names[player_id],
+                    "positions": [round(count / num_runs, 4) for count in counts[player_id]],
+                    "win": round(counts[player_id][0] / num_runs, 4),
+                }
+                for player_id in standings
+            ],
+        }
+        _cache[tournament_id] = key, projection
+        return projection
+    return wait
+
+
+def discard(tournament_id):
+    _cache.pop(tournament_id, None)
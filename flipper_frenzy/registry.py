@@ -0,0 +1,295 @@
+import contextlib
+import hashlib
+import threading
+import time
+
+import flipper_frenzy.broadcast
+import flipper_frenzy.journal
+import flipper_frenzy.main
+import flipper_frenzy.metrics
+
+STALE_MESSAGE = (
+    "Someone else changed that since you loaded the page, have a look and try again!"
+)
+
+# finished matches kept in memory, the older ones are moved to the store
+RECENT_MATCHES = 50
+# finished matches to collect beyond RECENT_MATCHES before archiving, so
+# they're written in batches rather than one by one
+ARCHIVE_BATCH = 50
+
+# seconds a tournament can go unused before it's dropped from memory
+IDLE_TIMEOUT = 3600
+# seconds between looking for idle tournaments
+EVICT_INTERVAL = 60
+
+
+def shard_for(tournament_id, num_shards):
+    """Pick the shard that owns a tournament.
+
+    Uses rendezvous hashing, so every process agrees on the owner without
+    talking to each other, and adding a shard only moves the tournaments
+    that the new shard ends up owning.
+    """
+    return max(
+        range(num_shards),
+        key=lambda shard: hashlib.md5(f"{shard}:{tournament_id}".encode()).digest(),
+    )
+
+
+class TournamentRegistry:
+    """Keep live Tournament objects resident between requests.
+
+    Tournaments are only rebuilt from the store the first time they're
+    used. After that each mutation is journaled and broadcast to any
+    subscribers as it happens, and the full tournament is only serialized
+    when the journal takes a snapshot.
+    Each tournament has its own lock so threads can share the registry.
+
+    Only the most recent finished matches stay in memory and in snapshots,
+    older ones are archived to the store's match history.
+
+    When several processes serve the same store, each one is a shard and
+    only keeps the tournaments it owns resident, so a tournament's state
+    and lock never live in two places at once.
+
+    Tournaments nobody has used for idle_timeout seconds, and that have no
+    subscribers, are snapshotted and dropped, to be loaded again from the
+    store if they're needed.
+    """
+
+    def __init__(self, store, snapshot_interval=flipper_frenzy.journal.SNAPSHOT_INTERVAL,
+                 shard=0, num_shards=1, recent_matches=RECENT_MATCHES,
+                 archive_batch=ARCHIVE_BATCH, idle_timeout=IDLE_TIMEOUT):
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"Shard {shard} is out of range for {num_shards} shards")
+        self.store = store
+        self.snapshot_interval = snapshot_interval
+        self.recent_matches = recent_matches
+        self.archive_batch = archive_batch
+        self.idle_timeout = idle_timeout
+        self.shard = shard
+        self.num_shards = num_shards
+        self._tournaments = {}
+        self._journals = {}
+        self._broadcasters = {}
+        # tournament id -> [lock, number of threads holding or waiting for it]
+        self._locks = {}
+        self._last_used = {}
+        self._last_evicted = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tournaments)
+
+    def num_subscribers(self):
+        """Count the clients subscribed to any tournament's events."""
+        broadcasters = list(self._broadcasters.values())
+        return sum(len(broadcaster) for broadcaster in broadcasters)
+
+    @contextlib.contextmanager
+    def _hold(self, tournament_id):
+        """Hold the tournament's own lock.
+
+        Threads waiting for the lock are counted, so it's never dropped by
+        evict_idle while anyone could still take it.
+        """
+        with self._lock:
+            entry = self._locks.get(tournament_id)
+            if entry is None:
+                entry = self._locks[tournament_id] = [threading.RLock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                self._last_used[tournament_id] = time.monotonic()
+                if not (entry[1] or tournament_id in self._tournaments
+                        or tournament_id in self._broadcasters):
+                    # only looked up and not found, nothing worth keeping
+                    self._journals.pop(tournament_id, None)
+                    del self._locks[tournament_id]
+                    del self._last_used[tournament_id]
+
+    def evict_idle(self, now=None):
+        """Snapshot and drop tournaments that haven't been used for a while.
+
+        Returns how many were dropped.
+        """
+        if now is None:
+            now = time.monotonic()
+        evicted = 0
+        with self._lock:
+            self._last_evicted = now
+            for tournament_id, entry in list(self._locks.items()):
+                broadcaster = self._broadcasters.get(tournament_id)
+                if (entry[1] or (broadcaster is not None and len(broadcaster))
+                        or now - self._last_used.get(tournament_id, now) < self.idle_timeout):
+                    continue
+                t = self._uninstall(tournament_id)
+                journal = self._journals.pop(tournament_id, None)
+                if t is not None and journal.num_events:
+                    journal.snapshot(t)
+                self._broadcasters.pop(tournament_id, None)
+                del self._locks[tournament_id]
+                del self._last_used[tournament_id]
+                evicted += 1
+        if evicted:
+            flipper_frenzy.metrics.count("tournaments_evicted_total", evicted)
+        return evicted
+
+    def _maybe_evict(self):
+        if time.monotonic() - self._last_evicted >= EVICT_INTERVAL:
+            self.evict_idle()
+
+    def _get_journal(self, tournament_id):
+        journal = self._journals.get(tournament_id)
+        if journal is None:
+            journal = flipper_frenzy.journal.Journal(
+                self.store, tournament_id, self.snapshot_interval
+            )
+            self._journals[tournament_id] = journal
+        return journal
+
+    def _get_broadcaster(self, tournament_id):
+        broadcaster = self._broadcasters.get(tournament_id)
+        if broadcaster is None:
+            broadcaster = flipper_frenzy.broadcast.Broadcaster()
+            self._broadcasters[tournament_id] = broadcaster
+        return broadcaster
+
+    def _install(self, tournament_id, t):
+        """Make t the live tournament, journaling and broadcasting its events."""
+        self._get_journal(tournament_id).attach(t)
+        t.add_listener(self._get_broadcaster(tournament_id).publish)
+        self._tournaments[tournament_id] = t
+
+    def _uninstall(self, tournament_id):
+        t = self._tournaments.pop(tournament_id, None)
+        if t is not None:
+            self._journals[tournament_id].detach(t)
+            t.remove_listener(self._broadcasters[tournament_id].publish)
+        return t
+
+    def _load(self, tournament_id):
+        t = self._tournaments.get(tournament_id)
+        if t is None:
+            t = self._get_journal(tournament_id).load()
+            if t is None:
+                return None
+            self._install(tournament_id, t)
+        return t
+
+    def owner(self, tournament_id):
+        """Return the shard that should serve the tournament."""
+        if self.num_shards == 1:
+            return 0
+        return shard_for(tournament_id, self.num_shards)
+
+    def owns(self, tournament_id):
+        return self.owner(tournament_id) == self.shard
+
+    def new_id(self):
+        """Return an unused tournament id owned by this shard."""
+        while True:
+            tournament_id = self.store.new_id()
+            if self.owns(tournament_id):
+                return tournament_id
+
+    def exists(self, tournament_id):
+        with self._hold(tournament_id):
+            return self._load(tournament_id) is not None
+
+    @contextlib.contextmanager
+    def checkout(self, tournament_id, create=True):
+        """Hold the tournament's lock and yield the live Tournament.
+
+        A new tournament is created if the id is unknown. Mutations made
+        inside the block are journaled and broadcast as they happen.
+        Without create an unknown id gets an empty Tournament that isn't
+        kept, for views that only read it.
+        """
+        self._maybe_evict()
+        with self._hold(tournament_id):
+            t = self._load(tournament_id)
+            if t is None:
+                t = flipper_frenzy.main.Tournament()
+                if not create:
+                    yield t
+                    return
+                self._install(tournament_id, t)
+            try:
+                yield t
+            finally:
+                self._archive(tournament_id, t)
+                self._journals[tournament_id].maybe_snapshot(t)
+
+    def _archive(self, tournament_id, t):
+        """Move old finished matches out of memory and into the store.
+
+        They're written before the snapshot that leaves them out, and
+        archiving is idempotent, so a crash in between loses nothing.
+        """
+        if len(t._matches) < self.recent_matches + self.archive_batch:
+            return
+        dropped = t.prune_matches(self.recent_matches)
+        if dropped:
+            self.store.archive_matches(
+                tournament_id, [match.serialize() for match in dropped]
+            )
+
+    def mutate(self, tournament_id, command, *args, base_version=None, touches=(),
+               **kwargs):
+        """Run one of the tournament's mutation methods and return its message.
+
+        Every scorer's commands go through here, one at a time, against the
+        live tournament. base_version is the version the scorer last saw,
+        and if anything in touches, (kind, key) pairs like those of
+        Tournament.changed_at, changed after it, the command is rejected
+        rather than applied to something the scorer hasn't seen. Commands
+        that touch nothing are applied to whatever the state is now.
+        """
+        with self.checkout(tournament_id) as t:
+            if base_version is not None and any(
+                t.changed_at(kind, key) > base_version for kind, key in touches
+            ):
+                flipper_frenzy.metrics.count("stale_writes_total", command=command)
+                return STALE_MESSAGE
+            return getattr(t, command)(*args, **kwargs)
+
+    def get_broadcaster(self, tournament_id):
+        """Return the Broadcaster for the tournament's events.
+
+        Subscribe while holding the tournament (inside checkout) to be sure
+        no event is missed after reading its current version.
+        """
+        with self._hold(tournament_id):
+            return self._get_broadcaster(tournament_id)
+
+    def replace(self, tournament_id, t):
+        """Swap in a whole new Tournament, e.g. after a reset or edit."""
+        with self._hold(tournament_id):
+            old = self._uninstall(tournament_id)
+            if old is not None:
+                # keep versions moving forward so clients notice the swap
+                t.reset_changes(max(t.version, old.version) + 1)
+            self._get_journal(tournament_id).snapshot(t)
+            self._install(tournament_id, t)
+            self._broadcasters[tournament_id].publish(
+                {"type": "resync", "version": t.version}
+            )
+
+    def discard(self, tournament_id):
+        """Delete everything about a tournament, its history too.
+
+        The id can still be used. It's left with an empty tournament that
+        carries on from the old version, so ETags and ?since= versions from
+        before never match anything after.
+        """
+        with self._hold(tournament_id):
+            old = self._load(tournament_id)
+            self.store.delete(tournament_id)
+            if old is not None:
+                self.replace(tournament_id, flipper_frenzy.main.Tournament())
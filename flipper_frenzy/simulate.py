@@ -0,0 +1,208 @@
+"""Drive a Tournament through a simulated event and time its hot paths.
+
+Players and machines are added up front, then every free machine is filled
+with next_match, a random match is finished with a random winner, and now
+and then a player or machine is switched off or back on, like at a real
+event. Run it with e.g.:
+
+    python -m flipper_frenzy.simulate --players 16 64 256 1024 --pairing greedy matching
+
+Every strategy gets the same seed, so their numbers can be compared. A run
+that ends up with nobody able to play anybody stops early and is reported
+as stalled.
+"""
+import argparse
+import random
+import time
+
+import flipper_frenzy.main
+import flipper_frenzy.pairing
+import flipper_frenzy.snapshot
+
+OPERATIONS = (
+    "next_match", "complete_match", "serialize", "restore", "dump_snapshot",
+    "load_snapshot",
+)
+
+
+class Timings:
+    """Collect how long each call of an operation took, in seconds."""
+
+    def __init__(self):
+        self.samples = {name: [] for name in OPERATIONS}
+
+    def time(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.samples[name].append(time.perf_counter() - start)
+        return result
+
+    def summarize(self, name):
+        samples = sorted(self.samples[name])
+        if not samples:
+            return {"calls": 0, "mean_ms": 0, "p95_ms": 0, "max_ms": 0}
+        return {
+            "calls": len(samples),
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "p95_ms": samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000,
+            "max_ms": samples[-1] * 1000,
+        }
+
+
+def toggle_one(rng, names, enable_func, toggle_back):
+    """Switch a random enabled item off, or with toggle_back turn one back on."""
+    disabled = [name for name, enabled in names if not enabled]
+    if disabled and toggle_back:
+        enable_func(rng.choice(disabled), True)
+    else:
+        enabled = [name for name, enabled in names if enabled]
+        if len(enabled) > 2:
+            enable_func(rng.choice(enabled), False)
+
+
+def simulate(num_players, num_machines, pairing="greedy", num_matches=1000,
+             toggle_rate=0.05, snapshot_every=50, seed=0):
+    """Run one simulated event and return its timings and counters."""
+    rng = random.Random(seed)
+    # Tournament.shuffle uses the module level random
+    random.seed(seed)
+    timings = Timings()
+
+    t = flipper_frenzy.main.Tournament()
+    t.set_pairing(pairing)
+    for i in range(num_machines):
+        t.add_machine(f"machine {i}")
+    for i in range(num_players):
+        t.add_player(f"player {i}")
+    t.shuffle()
+
+    active = []
+    num_completed = 0
+    failed_pairings = 0
+    stalled = False
+    busy_samples = []
+
+    while len(t._matches) < num_matches:
+        # fill every free machine, one next_match at a time
+        while True:
+            free = len(t._enabled_machines) - sum(
+                1 for match in active if match.machine.enabled
+            )
+            if free <= 0 or len(t._avail_players) < 2:
+                break
+            num_started = len(t._matches)
+            timings.time("next_match", t.next_match)
+            if len(t._matches) == num_started:
+                failed_pairings += 1
+                break
+            active.append(t._matches[0])
+
+        if t._enabled_machines:
+            busy = sum(1 for match in active if match.machine.enabled)
+            busy_samples.append(busy / len(t._enabled_machines))
+
+        if not active:
+            # nothing is being played and nothing could be started, so bring
+            # everyone back. if everyone already is, the event is stuck
+            disabled_players = [p for p in t._players.values() if not p.enabled]
+            disabled_machines = [m for m in t._machines.values() if not m.enabled]
+            if not disabled_players and not disabled_machines:
+                stalled = True
+                break
+            for player in disabled_players:
+                t.enable_player(player.name, True)
+            for machine in disabled_machines:
+                t.enable_machine(machine.name, True)
+            continue
+
+        match = active.pop(rng.randrange(len(active)))
+        winner = rng.choice((match.player_a, match.player_b))
+        timings.time("complete_match", t.complete_match, match.id, winner.name)
+        num_completed += 1
+
+        if rng.random() < toggle_rate:
+            toggle_one(
+                rng, [(p.name, p.enabled) for p in t._players.values()],
+                t.enable_player, rng.random() < 0.5,
+            )
+        if rng.random() < toggle_rate:
+            toggle_one(
+                rng, [(m.name, m.enabled) for m in t._machines.values()],
+                t.enable_machine, rng.random() < 0.5,
+            )
+
+        if num_completed % snapshot_every == 0:
+            data = timings.time("serialize", t.serialize)
+            restored = flipper_frenzy.main.Tournament()
+            timings.time("restore", restored.restore, data)
+            blob = timings.time("dump_snapshot", flipper_frenzy.snapshot.dumps, t)
+            timings.time("load_snapshot", flipper_frenzy.snapshot.loads, blob)
+
+    return {
+        "players": num_players,
+        "machines": num_machines,
+        "pairing": pairing,
+        "matches": len(t._matches),
+        "failed_pairings": failed_pairings,
+        "stalled": stalled,
+        "utilization": sum(busy_samples) / len(busy_samples) if busy_samples else 0,
+        "timings": {name: timings.summarize(name) for name in OPERATIONS},
+    }
+
+
+def print_report(results):
+    print(
+        f"{'players':>7} {'machines':>8} {'pairing':>8} {'matches':>7} "
+        f"{'failed':>6} {'util':>5} {'stall':>5}  {'operation':<14} {'calls':>6} "
+        f"{'mean ms':>8} {'p95 ms':>8} {'max ms':>8}"
+    )
+    for result in results:
+        first = True
+        for name, summary in result["timings"].items():
+            if first:
+                print(
+                    f"{result['players']:>7} {result['machines']:>8} "
+                    f"{result['pairing']:>8} {result['matches']:>7} "
+                    f"{result['failed_pairings']:>6} {result['utilization']:>5.0%} "
+                    f"{'yes' if result['stalled'] else 'no':>5}  ",
+                    end="",
+                )
+            else:
+                print(" " * 48, end="")
+            print(
+                f"{name:<14} {summary['calls']:>6} {summary['mean_ms']:>8.3f} "
+                f"{summary['p95_ms']:>8.3f} {summary['max_ms']:>8.3f}"
+            )
+            first = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[16, 64, 256, 1024])
+    parser.add_argument(
+        "--machines", type=int,
+        help="number of machines, defaults to one per four players",
+    )
+    parser.add_argument(
+        "--pairing", nargs="+", default=list(flipper_frenzy.pairing.PAIRING_STRATEGIES),
+        choices=list(flipper_frenzy.pairing.PAIRING_STRATEGIES),
+    )
+    parser.add_argument("--matches", type=int, default=1000)
+    parser.add_argument("--toggle-rate", type=float, default=0.05)
+    parser.add_argument("--snapshot-every", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for num_players in args.players:
+        num_machines = args.machines or max(num_players // 4, 2)
+        for pairing in args.pairing:
+            results.append(simulate(
+                num_players, num_machines, pairing, args.matches,
+                args.toggle_rate, args.snapshot_every, args.seed,
+            ))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Compact binary snapshots of a whole tournament.
+
+The dict from Tournament.serialize repeats names wherever a player or
+machine is referenced. A snapshot stores every name once and refers to
+players and machines by their roster ids instead, so opponents and
+machines are kept as the same bitsets the tournament uses and matches are
+fixed size records. Loading puts those straight back, without going
+through the tournament's mutation methods.
+
+Layout, all little-endian:
+
+    header    magic, format version, flags, tournament version, and the
+              number of machines, players, queued players and matches
+    next id   u32 id for the next match
+    pairing   u16 length and utf-8 name of the pairing strategy
+    format    u16 length and utf-8 name of the format, then u32 length and
+              utf-8 JSON of its state
+    names     u16 byte length of each machine's then each player's name,
+              followed by the utf-8 names
+    machines  u8 enabled and the players_mask bitset, per machine
+    players   u32 wins, losses and played, u8 enabled, u32 rounds and
+              machine rounds, then the opponents, faced_by and machines
+              bitsets, per player
+    queue     u32 id of each queued player, in order
+    active    u32 count, then the u32 position of each match still being
+              played
+    matches   u32 id, player a, player b and machine, i32 winner (-1
+              while being played) and f64 completion time (0 if unknown),
+              newest first
+
+Players and machines are stored in roster order, so loading hands out the
+same ids and every bitset can be used as is. The match records are handed
+to the tournament's MatchHistory untouched, which only unpacks the ones
+being played until the others are asked for.
+"""
+import json
+import mmap
+import os
+import struct
+
+import flipper_frenzy.formats
+import flipper_frenzy.main
+import flipper_frenzy.pairing
+
+MAGIC = b"FFSN"
+FORMAT_VERSION = 1
+
+FLAG_SORT_BY_RANK = 1
+
+HEADER = struct.Struct("<4sHHQIIII")
+LENGTH = struct.Struct("<H")
+STATE_LENGTH = struct.Struct("<I")
+PLAYER = struct.Struct("<IIIBII")
+MATCH = flipper_frenzy.main.MATCH_RECORD
+NEXT_ID = struct.Struct("<I")
+
+
+def _num_bytes(num_bits):
+    return (num_bits + 7) // 8
+
+
+def dumps(t):
+    """Pack the tournament into a snapshot and return it as bytes."""
+    machines = t._roster.machines
+    players = t._roster.players
+    player_bytes = _num_bytes(len(players))
+    machine_bytes = _num_bytes(len(machines))
+
+    flags = FLAG_SORT_BY_RANK if t._sort_by_rank else 0
+    pairing = t._pairing.name.encode()
+    format_name = t._format.name.encode()
+    format_state = json.dumps(t._format.serialize(), separators=(",", ":")).encode()
+    names = [m.name.encode() for m in machines] + [p.name.encode() for p in players]
+
+    parts = [
+        HEADER.pack(
+            MAGIC, FORMAT_VERSION, flags, t.version, len(machines),
+            len(players), len(t._avail_players), len(t._matches),
+        ),
+        NEXT_ID.pack(t._next_match_id),
+        LENGTH.pack(len(pairing)),
+        pairing,
+        LENGTH.pack(len(format_name)),
+        format_name,
+        STATE_LENGTH.pack(len(format_state)),
+        format_state,
+        struct.pack(f"<{len(names)}H", *(len(name) for name in names)),
+    ]
+    parts.extend(names)
+
+    for machine in machines:
+        parts.append(b"\x01" if machine.enabled else b"\x00")
+        parts.append(machine.players_mask.to_bytes(player_bytes, "little"))
+
+    for player in players:
+        parts.append(PLAYER.pack(
+            player.num_wins, player.num_losses, player.num_played, player.enabled,
+            player.rounds, player.machine_rounds,
+        ))
+        parts.append(player.opponents_mask.to_bytes(player_bytes, "little"))
+        parts.append(player.faced_by_mask.to_bytes(player_bytes, "little"))
+        parts.append(player.machines_mask.to_bytes(machine_bytes, "little"))
+
+    queue = [player.id for player in t._avail_players]
+    parts.append(struct.pack(f"<{len(queue)}I", *queue))
+
+    active = t._matches.active_indexes()
+    parts.append(struct.pack(f"<I{len(active)}I", len(active), *active))
+    parts.append(t._matches.pack())
+
+    return b"".join(parts)
+
+
+def loads(buffer):
+    """Rebuild a Tournament from a snapshot in any bytes-like buffer."""
+    with memoryview(buffer) as view:
+        return _load(view)
+
+
+def _load(view):
+    (
+        magic, format_version, flags, version, num_machines, num_players,
+        queue_length, num_matches,
+    ) = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("Not a tournament snapshot")
+    if format_version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {format_version}")
+    offset = HEADER.size
+    player_bytes = _num_bytes(num_players)
+    machine_bytes = _num_bytes(num_machines)
+
+    t = flipper_frenzy.main.Tournament()
+    t._sort_by_rank = bool(flags & FLAG_SORT_BY_RANK)
+    (t._next_match_id,) = NEXT_ID.unpack_from(view, offset)
+    offset += NEXT_ID.size
+
+    (length,) = LENGTH.unpack_from(view, offset)
+    offset += LENGTH.size
+    pairing = str(view[offset:offset + length], "utf-8")
+    offset += length
+    t._pairing = flipper_frenzy.pairing.PAIRING_STRATEGIES[pairing]()
+
+    (length,) = LENGTH.unpack_from(view, offset)
+    offset += LENGTH.size
+    format_name = str(view[offset:offset + length], "utf-8")
+    offset += length
+    (length,) = STATE_LENGTH.unpack_from(view, offset)
+    offset += STATE_LENGTH.size
+    format_state = json.loads(str(view[offset:offset + length], "utf-8"))
+    offset += length
+    t._format = flipper_frenzy.formats.FORMATS[format_name]()
+    t._format.restore(format_state)
+
+    num_names = num_machines + num_players
+    lengths = struct.unpack_from(f"<{num_names}H", view, offset)
+    offset += 2 * num_names
+    names = []
+    for length in lengths:
+        names.append(str(view[offset:offset + length], "utf-8"))
+        offset += length
+
+    for name in names[:num_machines]:
+        machine = flipper_frenzy.main.Machine(name, bool(view[offset]))
+        offset += 1
+        machine.players_mask = int.from_bytes(
+            view[offset:offset + player_bytes], "little"
+        )
+        offset += player_bytes
+        t._roster.add_machine(machine)
+        t._machines[name] = machine
+        if machine.enabled:
+            t._enabled_machines.add(machine)
+            t._enabled_machines_mask |= machine.bit
+    t._machine_names = sorted(t._machines)
+
+    for name in names[num_machines:]:
+        num_wins, num_losses, num_played, enabled, rounds, machine_rounds = (
+            PLAYER.unpack_from(view, offset)
+        )
+        offset += PLAYER.size
+        player = flipper_frenzy.main.Player(
+            name, t._roster, num_wins=num_wins, num_losses=num_losses,
+            num_played=num_played, enabled=bool(enabled), rounds=rounds,
+            machine_rounds=machine_rounds,
+        )
+        player.opponents_mask = int.from_bytes(
+            view[offset:offset + player_bytes], "little"
+        )
+        offset += player_bytes
+        player.faced_by_mask = int.from_bytes(
+            view[offset:offset + player_bytes], "little"
+        )
+        offset += player_bytes
+        player.machines_mask = int.from_bytes(
+            view[offset:offset + machine_bytes], "little"
+        )
+        offset += machine_bytes
+        t._register_player(player)
+        if player.enabled:
+            t._enabled_players.add(player)
+            t._enabled_players_mask |= player.bit
+
+    players = t._roster.players
+
+    queue = struct.unpack_from(f"<{queue_length}I", view, offset)
+    offset += 4 * queue_length
+    t._avail_players.set_order(players[player_id] for player_id in queue)
+
+    (num_active,) = struct.unpack_from("<I", view, offset)
+    active = struct.unpack_from(f"<{num_active}I", view, offset + 4)
+    offset += 4 + 4 * num_active
+    t._matches.load(view[offset:offset + MATCH.size * num_matches], active)
+
+    t.reset_changes(version)
+    return t
+
+
+def dump(t, path):
+    """Write a snapshot file, replacing any previous one atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(dumps(t))
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    """Load a snapshot file by memory-mapping it rather than reading it in."""
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return loads(buffer)
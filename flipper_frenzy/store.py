@@ -0,0 +1,284 @@
+import json
+import sqlite3
+import threading
+import uuid
+
+# fields of an archived match, the same as in Match.serialize
+HISTORY_FIELDS = ("id", "player_a", "player_b", "machine_name", "winner", "completed_at")
+# default number of archived matches per page
+HISTORY_PAGE = 50
+
+
+def history_filter(match, player=None, machine=None, start=None, end=None,
+                   before=None):
+    """Check a serialized match against TournamentStore.get_history's filters."""
+    if before is not None and match["id"] >= before:
+        return False
+    if player is not None and player not in (match["player_a"], match["player_b"]):
+        return False
+    if machine is not None and machine != match["machine_name"]:
+        return False
+    completed_at = match["completed_at"]
+    if start is not None and (completed_at is None or completed_at < start):
+        return False
+    if end is not None and (completed_at is None or completed_at >= end):
+        return False
+    return True
+
+
+class TournamentStore:
+    """Server-side storage for serialized tournament data.
+
+    Tournaments are keyed by an opaque id so the session cookie only has to
+    carry that id instead of the whole tournament. Besides a snapshot of the
+    serialized tournament, each id has a journal of events recorded since
+    that snapshot was taken. Snapshots are the bytes of a binary snapshot,
+    see flipper_frenzy.snapshot.
+
+    Finished matches that were dropped from the live tournament are kept in
+    an append-only history, which can be queried a page at a time.
+    """
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def get(self, tournament_id):
+        """Return the stored tournament data, or None if there isn't any."""
+        raise NotImplementedError
+
+    def put(self, tournament_id, data):
+        """Store a new snapshot and drop the events it already includes."""
+        raise NotImplementedError
+
+    def delete(self, tournament_id):
+        raise NotImplementedError
+
+    def append_event(self, tournament_id, event):
+        raise NotImplementedError
+
+    def get_events(self, tournament_id):
+        """Return the events recorded since the last snapshot, in order."""
+        raise NotImplementedError
+
+    def archive_matches(self, tournament_id, matches):
+        """Add serialized finished matches to the tournament's history.
+
+        Matches already in the history are left alone, so archiving the same
+        match twice is harmless.
+        """
+        raise NotImplementedError
+
+    def get_history(self, tournament_id, player=None, machine=None, start=None,
+                    end=None, before=None, limit=HISTORY_PAGE):
+        """Return archived matches, newest first, that match every filter.
+
+        player can be on either side, start and end bound the completion
+        time (unix time, end excluded), and before only returns matches with
+        a lower id, to fetch the page after one ending with that id.
+        """
+        raise NotImplementedError
+
+    def delete_history(self, tournament_id):
+        raise NotImplementedError
+
+
+class MemoryStore(TournamentStore):
+    """Keep tournaments in the current process. Data is lost on restart."""
+
+    def __init__(self):
+        self._data = {}
+        self._events = {}
+        self._history = {}  # tournament id -> {match id: row tuple}
+        self._lock = threading.Lock()
+
+    def get(self, tournament_id):
+        with self._lock:
+            return self._data.get(tournament_id)
+
+    def put(self, tournament_id, data):
+        with self._lock:
+            self._data[tournament_id] = data
+            self._events.pop(tournament_id, None)
+
+    def delete(self, tournament_id):
+        with self._lock:
+            self._data.pop(tournament_id, None)
+            self._events.pop(tournament_id, None)
+            self._history.pop(tournament_id, None)
+
+    def append_event(self, tournament_id, event):
+        blob = json.dumps(event)
+        with self._lock:
+            self._events.setdefault(tournament_id, []).append(blob)
+
+    def get_events(self, tournament_id):
+        with self._lock:
+            blobs = list(self._events.get(tournament_id, []))
+        return [json.loads(blob) for blob in blobs]
+
+    def archive_matches(self, tournament_id, matches):
+        rows = [tuple(match[field] for field in HISTORY_FIELDS) for match in matches]
+        with self._lock:
+            history = self._history.setdefault(tournament_id, {})
+            for row in rows:
+                history.setdefault(row[0], row)
+
+    def get_history(self, tournament_id, player=None, machine=None, start=None,
+                    end=None, before=None, limit=HISTORY_PAGE):
+        with self._lock:
+            rows = list(self._history.get(tournament_id, {}).values())
+        rows.sort(reverse=True)
+
+        matches = []
+        for row in rows:
+            match = dict(zip(HISTORY_FIELDS, row))
+            if history_filter(match, player, machine, start, end, before):
+                matches.append(match)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def delete_history(self, tournament_id):
+        with self._lock:
+            self._history.pop(tournament_id, None)
+
+
+class SQLiteStore(TournamentStore):
+    """Keep tournaments in a SQLite database, so they survive restarts.
+
+    Shards can share a database since each serves its own tournaments, but
+    two processes mustn't serve the same tournament from it, each would
+    keep its own copy (see gunicorn.conf.py).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tournaments ("
+                "id TEXT PRIMARY KEY, data BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "tournament_id TEXT NOT NULL, data TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS events_tournament "
+                "ON events (tournament_id, seq)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "tournament_id TEXT NOT NULL, id INTEGER NOT NULL, "
+                "player_a TEXT NOT NULL, player_b TEXT NOT NULL, "
+                "machine_name TEXT NOT NULL, winner TEXT, completed_at REAL, "
+                "PRIMARY KEY (tournament_id, id))"
+            )
+            for column in ("player_a", "player_b", "machine_name", "completed_at"):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS history_{column} "
+                    f"ON history (tournament_id, {column}, id)"
+                )
+
+    def get(self, tournament_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM tournaments WHERE id = ?", (tournament_id,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, tournament_id, data):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tournaments (id, data) VALUES (?, ?)",
+                (tournament_id, data),
+            )
+            self._conn.execute(
+                "DELETE FROM events WHERE tournament_id = ?", (tournament_id,)
+            )
+
+    def delete(self, tournament_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM tournaments WHERE id = ?", (tournament_id,)
+            )
+            self._conn.execute(
+                "DELETE FROM events WHERE tournament_id = ?", (tournament_id,)
+            )
+            self._conn.execute(
+                "DELETE FROM history WHERE tournament_id = ?", (tournament_id,)
+            )
+
+    def append_event(self, tournament_id, event):
+        blob = json.dumps(event)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO events (tournament_id, data) VALUES (?, ?)",
+                (tournament_id, blob),
+            )
+
+    def get_events(self, tournament_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM events WHERE tournament_id = ? ORDER BY seq",
+                (tournament_id,),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def archive_matches(self, tournament_id, matches):
+        rows = [
+            (tournament_id, *(match[field] for field in HISTORY_FIELDS))
+            for match in matches
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO history (tournament_id, "
+                + ", ".join(HISTORY_FIELDS) + ") VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def get_history(self, tournament_id, player=None, machine=None, start=None,
+                    end=None, before=None, limit=HISTORY_PAGE):
+        conditions = ["tournament_id = ?"]
+        params = [tournament_id]
+        if before is not None:
+            conditions.append("id < ?")
+            params.append(before)
+        if player is not None:
+            conditions.append("(player_a = ? OR player_b = ?)")
+            params.extend((player, player))
+        if machine is not None:
+            conditions.append("machine_name = ?")
+            params.append(machine)
+        if start is not None:
+            conditions.append("completed_at >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("completed_at < ?")
+            params.append(end)
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT " + ", ".join(HISTORY_FIELDS) + " FROM history WHERE "
+                + " AND ".join(conditions) + " ORDER BY id DESC LIMIT ?",
+                params,
+            ).fetchall()
+        return [dict(zip(HISTORY_FIELDS, row)) for row in rows]
+
+    def delete_history(self, tournament_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM history WHERE tournament_id = ?", (tournament_id,)
+            )
+
+
+def open_store(uri):
+    """Create a store from a uri, either 'memory' or 'sqlite:<path>'."""
+    if uri == "memory":
+        return MemoryStore()
+    if uri.startswith("sqlite:"):
+        return SQLiteStore(uri[len("sqlite:"):])
+    raise ValueError(f"Unknown tournament store '{uri}'")
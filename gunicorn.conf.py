@@ -0,0 +1,21 @@
+"""Gunicorn settings, picked up automatically from the working directory.
+
+Live tournaments are kept resident in the process that serves them (see
+flipper_frenzy.registry), so a tournament must never be served by two
+processes at once. Every gunicorn runs a single worker with threads, and
+WEB_CONCURRENCY (which Heroku sets) is ignored. To use more processes, run
+one gunicorn per shard, see flipper_frenzy.asgi.
+"""
+import os
+
+workers = 1
+threads = int(os.environ.get("FLIPPER_FRENZY_THREADS", "8"))
+
+
+def on_starting(server):
+    if server.cfg.workers > 1:
+        raise RuntimeError(
+            f"Can't run {server.cfg.workers} workers, each would keep its own copy of "
+            "every tournament. Run one gunicorn per shard instead, with "
+            "FLIPPER_FRENZY_SHARD_URLS and FLIPPER_FRENZY_SHARD"
+        )
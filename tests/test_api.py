@@ -0,0 +1,55 @@
+"""Polling clients get 304s and deltas, and never another tournament's."""
+import flipper_frenzy.app
+
+app = flipper_frenzy.app.app
+
+
+def new_client(tournament_id, players):
+    client = app.test_client()
+    for name in players:
+        client.post(f"/t/{tournament_id}/add-player", data={"name": name})
+    return client
+
+
+def test_etag_and_304():
+    client = new_client("api-etag", ["alice", "bob"])
+    response = client.get("/t/api-etag/api/players")
+    etag = response.headers["ETag"]
+    assert [p["name"] for p in response.get_json()["players"]] == ["alice", "bob"]
+
+    response = client.get("/t/api-etag/api/players", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post("/t/api-etag/add-player", data={"name": "carol"})
+    response = client.get("/t/api-etag/api/players", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_since_returns_only_changes():
+    client = new_client("api-since", ["alice", "bob"])
+    version = client.get("/t/api-since/api/tournament").get_json()["version"]
+    client.post("/t/api-since/add-player", data={"name": "carol"})
+
+    data = client.get(f"/t/api-since/api/tournament?since={version}").get_json()
+    assert data["since"] == version
+    assert [p["name"] for p in data["players"]] == ["carol"]
+
+
+def test_reset_never_reuses_versions():
+    client = new_client("api-reset", ["alice", "bob", "carol"])
+    response = client.get("/t/api-reset/api/players")
+    etag = response.headers["ETag"]
+    version = response.get_json()["version"]
+
+    client.post("/t/api-reset/reset-all")
+    for name in ["x", "y", "z"]:
+        client.post("/t/api-reset/add-player", data={"name": name})
+
+    response = client.get("/t/api-reset/api/players", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [p["name"] for p in response.get_json()["players"]] == ["x", "y", "z"]
+    # too far back for the new tournament's change log, so everything
+    data = client.get(f"/t/api-reset/api/tournament?since={version - 1}").get_json()
+    assert "since" not in data
+    assert [p["name"] for p in data["players"]] == ["x", "y", "z"]
@@ -0,0 +1,55 @@
+"""Cached html has to change as soon as what it shows does."""
+import flipper_frenzy.app
+import flipper_frenzy.cache
+
+app = flipper_frenzy.app.app
+
+
+def cached_keys(tournament_id):
+    return {
+        key for key in flipper_frenzy.app.render_cache._entries if key[0] == tournament_id
+    }
+
+
+def test_lru_bounded_by_size():
+    cache = flipper_frenzy.cache.RenderCache(max_size=10)
+    cache.put(("t", "a", None, 1), "aaaa")
+    cache.put(("t", "b", None, 1), "bbbb")
+    assert cache.get(("t", "a", None, 1)) == "aaaa"
+    # b is the least recently used, so it goes to make room
+    cache.put(("t", "c", None, 1), "cccc")
+    assert cache.get(("t", "b", None, 1)) is None
+    assert cache.size == 8
+
+    cache.put(("u", "a", None, 1), "u")
+    cache.discard("t")
+    assert len(cache) == 1
+    assert cache.size == 1
+
+
+def test_mutations_invalidate_only_what_they_touch():
+    client = app.test_client()
+    client.post("/t/cache/add-player", data={"name": "alice"})
+    client.get("/t/cache/")
+    before = cached_keys("cache")
+
+    client.post("/t/cache/add-machine", data={"name": "medieval madness"})
+    assert "medieval madness" in client.get("/t/cache/").get_data(as_text=True)
+    added = cached_keys("cache") - before
+    # a new machine is a change for every player, but not for the matches
+    assert {key[1] for key in added} == {"machines", "players"}
+
+
+def test_player_page_shows_new_results():
+    client = app.test_client()
+    for name in ["alice", "bob"]:
+        client.post("/t/cache-player/add-player", data={"name": name})
+    client.post("/t/cache-player/add-machine", data={"name": "twilight zone"})
+    page = client.get("/t/cache-player/player/alice").get_data(as_text=True)
+    assert "fa-check-circle" not in page
+
+    with flipper_frenzy.app.registry.checkout("cache-player") as t:
+        t.next_match()
+        t.complete_match(t._matches[0].id, "alice")
+    page = client.get("/t/cache-player/player/alice").get_data(as_text=True)
+    assert "fa-check-circle" in page
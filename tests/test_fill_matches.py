@@ -0,0 +1,40 @@
+"""Filling every free machine at once has to pick what next_match would."""
+import random
+
+import pytest
+
+import flipper_frenzy.main
+import tests.test_pairing
+
+new_tournament = tests.test_pairing.new_tournament
+step = tests.test_pairing.step
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("pairing", ["greedy", "matching"])
+def test_fill_matches_same_as_next_match(seed, pairing):
+    rng = random.Random(seed)
+    t = new_tournament(rng, pairing)
+    for _ in range(rng.randint(0, 200)):
+        step(t, rng)
+    data = t.serialize()
+
+    filled = flipper_frenzy.main.Tournament()
+    filled.restore(data)
+    filled.fill_matches()
+
+    one_by_one = flipper_frenzy.main.Tournament()
+    one_by_one.restore(data)
+    if pairing == "greedy":
+        while len(one_by_one._avail_players) >= 2:
+            num_matches = len(one_by_one._matches)
+            one_by_one.next_match()
+            if len(one_by_one._matches) == num_matches:
+                break
+        assert filled.serialize() == one_by_one.serialize()
+
+    # either way nobody plays twice at once or someone they've faced
+    started = [match for match in filled._matches if match.winner is None]
+    players = [player for match in started for player in (match.player_a, match.player_b)]
+    assert len(players) == len(set(players))
+    assert len({match.machine for match in started}) == len(started)
@@ -0,0 +1,51 @@
+"""Formats that play in rounds have to pair everyone fairly."""
+import random
+
+import pytest
+
+import flipper_frenzy.main
+
+
+def new_tournament(format_name, num_players, num_machines=4):
+    t = flipper_frenzy.main.Tournament()
+    t.set_format(format_name)
+    for i in range(num_machines):
+        t.add_machine(f"machine {i}")
+    t.add_players([f"player {i}" for i in range(num_players)])
+    return t
+
+
+def play_round(t, rng):
+    """Play every match of the current round, with random winners."""
+    round_number = t._format.round
+    while True:
+        t.fill_matches()
+        active = [match for match in t._matches if match.winner is None]
+        if not active or t._format.round != round_number:
+            return
+        for match in active:
+            t.complete_match(match.id, rng.choice((match.player_a, match.player_b)).name)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_swiss_has_no_rematches_while_it_can(seed):
+    rng = random.Random(seed)
+    t = new_tournament("swiss", 16)
+    played = set()
+    # with 16 players and at most 8 rounds everyone has enough opponents left
+    for _ in range(8):
+        t.fill_matches()
+        pairs = {frozenset(pair) for pair in t._format.pairs}
+        assert len(pairs) == 8
+        assert not pairs & played
+        played |= pairs
+        play_round(t, rng)
+
+
+def test_swiss_bye_counts_as_a_win():
+    t = new_tournament("swiss", 5)
+    t.fill_matches()
+    (bye,) = [name for name, other in t._format.pairs if other is None]
+    player = t._players[bye]
+    assert (player.num_wins, player.num_played) == (1, 1)
+    assert t._standings.rank(player) == 1
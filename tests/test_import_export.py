@@ -0,0 +1,63 @@
+"""Imports take the files people have, exports give back what's there."""
+import csv
+import io
+import json
+
+import flipper_frenzy.app
+
+app = flipper_frenzy.app.app
+
+
+def import_players(client, tournament_id, data):
+    client.post(f"/t/{tournament_id}/import-players", data={"data": data})
+    with client.session_transaction() as session:
+        return session.get("message")
+
+
+def player_names(client, tournament_id):
+    response = client.get(f"/t/{tournament_id}/api/players")
+    return sorted(p["name"] for p in response.get_json()["players"])
+
+
+def test_import_formats():
+    client = app.test_client()
+    assert import_players(client, "import", '["alice", {"name": "bob"}]') == (
+        "Added 2 new players"
+    )
+    assert import_players(client, "import", "name,club\ncarol,x\ndave,y\n") == (
+        "Added 2 new players"
+    )
+    assert import_players(client, "import", "erin\nfrank\nalice\n") == "Added 2 new players"
+    assert player_names(client, "import") == [
+        "alice", "bob", "carol", "dave", "erin", "frank",
+    ]
+
+
+def test_unreadable_imports_add_nothing():
+    client = app.test_client()
+    for data in ('{"names": ["alice", "bob"]}', '["alice", {"club": "x"}]', "[1, 2"):
+        assert import_players(client, "bad-import", data) == (
+            "Could not read the uploaded file!"
+        )
+    assert player_names(client, "bad-import") == []
+
+
+def test_exports():
+    client = app.test_client()
+    import_players(client, "export", '["alice", "bob", "carol"]')
+    client.post("/t/export/add-machine", data={"name": "machine"})
+    with flipper_frenzy.app.registry.checkout("export") as t:
+        t.next_match()
+        match = t._matches[0]
+        t.complete_match(match.id, match.player_a.name)
+        winner = match.player_a.name
+
+    text = client.get("/t/export/export/standings.csv").get_data(as_text=True)
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert [row["rank"] for row in rows] == ["1", "2", "3"]
+    assert rows[0]["name"] == winner
+
+    text = client.get("/t/export/export/matches.ndjson").get_data(as_text=True)
+    matches = [json.loads(line) for line in text.splitlines()]
+    assert [(m["id"], m["winner"]) for m in matches] == [(match.id, winner)]
+    assert client.get("/t/export/export/players.csv").status_code == 404
@@ -0,0 +1,66 @@
+"""Tournaments have to come back the same from the journal."""
+import random
+
+import pytest
+
+import flipper_frenzy.formats
+import flipper_frenzy.journal
+import flipper_frenzy.main
+import flipper_frenzy.registry
+import flipper_frenzy.store
+import tests.test_snapshot
+
+play = tests.test_snapshot.play
+state = tests.test_snapshot.state
+
+
+def replay_state(store, t):
+    """Like state, but with the archived matches too.
+
+    Which finished matches are still in memory depends on when they were
+    last archived, so only all of them together have to be the same.
+    """
+    data, *rest = state(t)
+    matches = {match["id"]: match for match in data.pop("matches")}
+    for match in store.get_history("t", limit=10 ** 6):
+        matches.setdefault(match["id"], match)
+    return data, rest, sorted(matches.items())
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("format_name", list(flipper_frenzy.formats.FORMATS))
+def test_journal_replay(seed, format_name):
+    rng = random.Random(seed)
+    store = flipper_frenzy.store.MemoryStore()
+    registry = flipper_frenzy.registry.TournamentRegistry(store, snapshot_interval=13)
+    with registry.checkout("t") as t:
+        t.set_format(format_name)
+        for i in range(3):
+            t.add_machine(f"machine {i}")
+        for i in range(9):
+            t.add_player(f"player {i}")
+    for _ in range(100):
+        with registry.checkout("t") as t:
+            play(t, rng, 1)
+    with registry.checkout("t") as t:
+        expected = replay_state(store, t), t._format.serialize()
+
+    # a new registry has to rebuild it from the last snapshot and the journal
+    registry = flipper_frenzy.registry.TournamentRegistry(store, snapshot_interval=13)
+    with registry.checkout("t") as t:
+        assert (replay_state(store, t), t._format.serialize()) == expected
+
+
+def test_replay_without_a_snapshot():
+    store = flipper_frenzy.store.MemoryStore()
+    journal = flipper_frenzy.journal.Journal(store, "t", snapshot_interval=10 ** 6)
+    assert journal.load() is None
+
+    t = flipper_frenzy.main.Tournament()
+    journal.attach(t)
+    t.add_machines(["machine 0", "machine 1"])
+    t.add_players([f"player {i}" for i in range(7)])
+    play(t, random.Random(0), 40)
+
+    assert store.get("t") is None
+    assert state(journal.load()) == state(t)
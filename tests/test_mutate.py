@@ -0,0 +1,62 @@
+"""Scorers working from an old page mustn't overwrite what they haven't seen."""
+import flipper_frenzy.registry
+import flipper_frenzy.store
+
+STALE = flipper_frenzy.registry.STALE_MESSAGE
+
+
+def new_registry(num_players=4, num_machines=2):
+    registry = flipper_frenzy.registry.TournamentRegistry(flipper_frenzy.store.MemoryStore())
+    with registry.checkout("t") as t:
+        for i in range(num_machines):
+            t.add_machine(f"machine {i}")
+        t.add_players([f"player {i}" for i in range(num_players)])
+        t.fill_matches()
+    return registry
+
+
+def report(registry, match, winner, version):
+    return registry.mutate(
+        "t", "complete_match", match.id, winner.name, base_version=version,
+        touches=[("match", match.id)],
+    )
+
+
+def test_stale_result_rejected():
+    registry = new_registry()
+    with registry.checkout("t") as t:
+        match = t._matches[0]
+        version = t.last_changed("match")
+
+    assert report(registry, match, match.player_a, version) == "Match finished!"
+    # a second scorer on the same page says the other player won
+    assert report(registry, match, match.player_b, version) == STALE
+    assert match.winner is match.player_a
+    # the same result again is harmless
+    with registry.checkout("t") as t:
+        version = t.last_changed("match")
+    assert report(registry, match, match.player_a, version) == "Match finished!"
+
+
+def test_other_changes_dont_make_a_result_stale():
+    registry = new_registry()
+    with registry.checkout("t") as t:
+        match, other = t._matches[0], t._matches[1]
+        version = t.last_changed("match")
+        t.complete_match(other.id, other.player_a.name)
+        t.add_player("late comer")
+
+    assert report(registry, match, match.player_b, version) == "Match finished!"
+
+
+def test_results_accepted_after_change_log_is_trimmed():
+    registry = new_registry(num_players=1500, num_machines=1)
+    with registry.checkout("t") as t:
+        match = t._matches[0]
+        version = t.last_changed("match")
+        # every new machine is a change for every player
+        for i in range(8):
+            t.add_machine(f"extra machine {i}")
+        assert t.get_changes(version) is None
+
+    assert report(registry, match, match.player_b, version) == "Match finished!"
@@ -0,0 +1,77 @@
+"""Pairing has to keep picking the same matches as the original next_match.
+
+The original looped over every pair of queued players with sets of
+opponents and machines. The bitset version must agree with it, so these
+replay random events and check each pick against that loop.
+"""
+import itertools
+import random
+
+import pytest
+
+import flipper_frenzy.main
+
+
+def reference_pair(t, check_machines):
+    """The pair the original next_match would have picked."""
+    for player_a, player_b in itertools.combinations(t._avail_players, 2):
+        if player_b in player_a.opponents or player_a in player_b.opponents:
+            continue
+        if check_machines:
+            machines = player_a.machines & player_b.machines
+        else:
+            machines = player_a.machines
+        if any(machine.enabled and not machine.active for machine in machines):
+            return player_a, player_b
+    return None
+
+
+def new_tournament(rng, pairing="greedy"):
+    t = flipper_frenzy.main.Tournament()
+    t.set_pairing(pairing)
+    for i in range(rng.randint(1, 8)):
+        t.add_machine(f"machine {i}")
+    for i in range(rng.randint(2, 30)):
+        t.add_player(f"player {i}")
+    return t
+
+
+def step(t, rng):
+    """Do one random thing to the tournament, like at a real event."""
+    active = [match for match in t._matches if match.winner is None]
+    r = rng.random()
+    if active and r < 0.45:
+        match = rng.choice(active)
+        t.complete_match(match.id, rng.choice((match.player_a, match.player_b)).name)
+    elif r < 0.5:
+        names = [player.name for player in t._avail_players]
+        t.set_queue(rng.sample(names, len(names)))
+    elif r < 0.55:
+        t.enable_player(rng.choice(list(t._players)), rng.random() < 0.6)
+    elif r < 0.58:
+        machine = rng.choice(list(t._machines.values()))
+        t.enable_machine(machine.name, not machine.enabled)
+    else:
+        t.next_match()
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_greedy_matches_original(seed):
+    rng = random.Random(seed)
+    t = new_tournament(rng)
+    for _ in range(150):
+        for check_machines in (True, False):
+            expected = reference_pair(t, check_machines)
+            found = t._pairing.find_match(t, check_machines=check_machines)
+            if expected is None:
+                assert found is None
+                continue
+            player_a, player_b, machine = found
+            assert (player_a, player_b) == expected
+            # the original took any free machine they still had to play
+            assert machine.enabled and not machine.active
+            assert machine in player_a.machines
+            if check_machines:
+                assert machine in player_b.machines
+        step(t, rng)
+
@@ -0,0 +1,51 @@
+"""Projections mustn't depend on the machine they run on, or die with it."""
+import concurrent.futures.process
+import os
+
+import pytest
+
+import flipper_frenzy.main
+import flipper_frenzy.projection
+
+projection = flipper_frenzy.projection
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool(monkeypatch):
+    monkeypatch.setattr(projection, "_pool", None)
+    yield
+    if projection._pool is not None:
+        projection._pool.shutdown()
+
+
+def new_tournament():
+    t = flipper_frenzy.main.Tournament()
+    for i in range(3):
+        t.add_machine(f"machine {i}")
+    t.add_players([f"player {i}" for i in range(8)])
+    for _ in range(10):
+        t.fill_matches()
+        match = next(match for match in t._matches if match.winner is None)
+        t.complete_match(match.id, match.player_a.name)
+    return t
+
+
+def test_same_projection_for_any_number_of_workers(monkeypatch):
+    t = new_tournament()
+    projections = []
+    for workers in (1, 3):
+        monkeypatch.setattr(projection, "WORKERS", workers)
+        projection.reset_pool(projection.get_pool())
+        projection.discard("t")
+        projections.append(projection.project("t", t, num_runs=200)())
+    assert projections[0] == projections[1]
+
+
+def test_broken_pool_is_replaced():
+    pool = projection.get_pool()
+    with pytest.raises(concurrent.futures.process.BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+
+    result = projection.project("t", new_tournament(), num_runs=100)()
+    assert result["runs"] == 100
+    assert projection.get_pool() is not pool
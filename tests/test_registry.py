@@ -0,0 +1,57 @@
+"""Only tournaments that are in use stay resident."""
+import flipper_frenzy.registry
+import flipper_frenzy.store
+
+
+def new_registry(**kwargs):
+    return flipper_frenzy.registry.TournamentRegistry(
+        flipper_frenzy.store.MemoryStore(), **kwargs
+    )
+
+
+def test_reading_unknown_tournament_keeps_nothing():
+    registry = new_registry()
+    for i in range(20):
+        with registry.checkout(f"visitor {i}", create=False) as t:
+            assert not t._players
+    assert len(registry) == 0
+    assert not registry._locks
+
+    with registry.checkout("scorer") as t:
+        t.add_player("alice")
+    assert len(registry) == 1
+    with registry.checkout("scorer", create=False) as t:
+        assert list(t._players) == ["alice"]
+
+
+def test_idle_tournaments_are_evicted_and_reloaded():
+    registry = new_registry(idle_timeout=10)
+    with registry.checkout("t") as t:
+        t.add_machine("machine")
+        t.add_players(["alice", "bob", "carol"])
+        t.next_match()
+        data = t.serialize()
+        version = t.version
+
+    assert registry.evict_idle() == 0
+    assert registry.evict_idle(now=float("inf")) == 1
+    assert len(registry) == 0
+
+    with registry.checkout("t") as t:
+        assert t.serialize() == data
+        assert t.version == version
+
+
+def test_tournaments_in_use_are_kept():
+    registry = new_registry(idle_timeout=0)
+    with registry.checkout("held") as t:
+        t.add_player("alice")
+        assert registry.evict_idle(now=float("inf")) == 0
+    with registry.checkout("watched") as t:
+        t.add_player("bob")
+    subscription = registry.get_broadcaster("watched").subscribe()
+
+    assert registry.evict_idle(now=float("inf")) == 1
+    assert "watched" in registry._tournaments
+    subscription.close()
+    assert registry.evict_idle(now=float("inf")) == 1
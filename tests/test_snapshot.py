@@ -0,0 +1,82 @@
+"""Tournaments have to come back the same from a snapshot."""
+import random
+
+import pytest
+
+import flipper_frenzy.formats
+import flipper_frenzy.main
+import flipper_frenzy.snapshot
+
+snapshot = flipper_frenzy.snapshot
+
+
+def play(t, rng, num_steps):
+    """Play a random event on t, switching players and machines on and off."""
+    for _ in range(num_steps):
+        t.fill_matches()
+        active = [match for match in t._matches if match.winner is None]
+        if active:
+            match = rng.choice(active)
+            t.complete_match(
+                match.id, rng.choice((match.player_a, match.player_b)).name,
+                completed_at=1000.0 + match.id,
+            )
+        if rng.random() < 0.08:
+            t.enable_player(rng.choice(list(t._players)), rng.random() < 0.6)
+        if rng.random() < 0.04:
+            t.enable_machine(rng.choice(list(t._machines)), rng.random() < 0.6)
+
+
+def new_tournament(rng, format_name="rolling", num_players=None):
+    t = flipper_frenzy.main.Tournament()
+    t.set_pairing(rng.choice(("greedy", "matching")))
+    t.set_format(format_name)
+    for i in range(rng.randint(1, 6)):
+        t.add_machine(f"machine {i}")
+    for i in range(num_players or rng.randint(2, 20)):
+        t.add_player(f"pläyer {i}")
+    return t
+
+
+def state(t):
+    """Everything about t that should survive being saved and loaded."""
+    data = t.serialize()
+    for player in data["players"]:
+        # the order opponents come out in isn't kept
+        player["opponents"] = sorted(player["opponents"])
+    masks = [
+        (p.opponents_mask, p.faced_by_mask, p.machines_mask) for p in t._roster.players
+    ]
+    return data, masks, [p.name for p in t._standings], t.version
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("format_name", list(flipper_frenzy.formats.FORMATS))
+def test_snapshot_round_trip(seed, format_name):
+    rng = random.Random(seed)
+    t = new_tournament(rng, format_name)
+    play(t, rng, rng.randint(0, 150))
+    loaded = snapshot.loads(snapshot.dumps(t))
+    assert state(loaded) == state(t)
+    assert loaded._format.serialize() == t._format.serialize()
+
+    # and both carry on the same
+    for x in (t, loaded):
+        x.fill_matches()
+    assert state(loaded) == state(t)
+
+
+def test_long_names_are_refused():
+    t = flipper_frenzy.main.Tournament()
+    too_long = "ä" * (flipper_frenzy.main.MAX_NAME_LENGTH + 1)
+    assert "longer" in t.add_player(too_long)
+    assert "longer" in t.add_machine(too_long)
+    assert t.add_players([too_long, "bob"]) == "Added 1 new players"
+    assert t.add_machines([too_long]) == "Added 0 new machines"
+
+    # the longest names allowed still fit in a snapshot
+    longest = "ä" * flipper_frenzy.main.MAX_NAME_LENGTH
+    t.add_player(longest)
+    t.add_machine(longest)
+    loaded = snapshot.loads(snapshot.dumps(t))
+    assert state(loaded) == state(t)
@@ -0,0 +1,43 @@
+"""Standings kept sorted in place have to match sorting from scratch."""
+import random
+
+import pytest
+
+import flipper_frenzy.main
+
+rank_key = flipper_frenzy.main.Standings.rank_key
+
+
+def check_standings(t):
+    expected = sorted(t._players.values(), key=rank_key)
+    assert list(t._standings) == expected
+    assert [p["name"] for p in t.get_standings()] == [p.name for p in expected]
+    assert [p["rank"] for p in t.get_standings(top=3)] == [1, 2, 3][:len(expected)]
+    for rank, player in enumerate(expected, 1):
+        assert t.get_rank(player.name) == rank
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_standings_stay_sorted(seed):
+    rng = random.Random(seed)
+    t = flipper_frenzy.main.Tournament()
+    for i in range(3):
+        t.add_machine(f"machine {i}")
+    t.add_players([f"player {i}" for i in range(12)])
+    for _ in range(80):
+        t.fill_matches()
+        match = rng.choice([match for match in t._matches if match.winner is None])
+        t.complete_match(match.id, rng.choice((match.player_a, match.player_b)).name)
+        if rng.random() < 0.1:
+            t.enable_player(rng.choice(list(t._players)), rng.random() < 0.5)
+        if rng.random() < 0.05:
+            t.add_player(f"late {rng.randrange(10 ** 6)}")
+        check_standings(t)
+
+
+def test_unknown_player_has_no_rank():
+    t = flipper_frenzy.main.Tournament()
+    t.add_player("alice")
+    assert t.get_rank("alice") == 1
+    assert t.get_rank("bob") is None
+    assert t.get_standings(top=0) == []
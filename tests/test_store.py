@@ -0,0 +1,66 @@
+"""Both stores have to answer history queries the same way."""
+import pytest
+
+import flipper_frenzy.store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return flipper_frenzy.store.MemoryStore()
+    return flipper_frenzy.store.SQLiteStore(str(tmp_path / "tournaments.db"))
+
+
+def archived_match(match_id, player_a, player_b, machine, completed_at):
+    return {
+        "id": match_id, "player_a": player_a, "player_b": player_b,
+        "machine_name": machine, "winner": player_a, "completed_at": completed_at,
+    }
+
+
+MATCHES = [
+    archived_match(0, "alice", "bob", "medieval", 100.0),
+    archived_match(1, "carol", "alice", "twilight", 200.0),
+    archived_match(2, "bob", "carol", "medieval", 300.0),
+    archived_match(3, "dave", "bob", "twilight", 400.0),
+]
+
+
+def ids(matches):
+    return [match["id"] for match in matches]
+
+
+def test_history_filters(store):
+    store.archive_matches("t", MATCHES)
+    assert store.get_history("t") == MATCHES[::-1]
+    assert ids(store.get_history("t", player="alice")) == [1, 0]
+    assert ids(store.get_history("t", machine="medieval")) == [2, 0]
+    assert ids(store.get_history("t", start=200, end=400)) == [2, 1]
+    assert ids(store.get_history("t", player="bob", machine="twilight")) == [3]
+    assert store.get_history("other") == []
+
+
+def test_history_pages(store):
+    store.archive_matches("t", MATCHES)
+    assert ids(store.get_history("t", limit=3)) == [3, 2, 1]
+    assert ids(store.get_history("t", before=1, limit=3)) == [0]
+    assert ids(store.get_history("t", player="bob", before=3)) == [2, 0]
+
+
+def test_archiving_twice_is_harmless(store):
+    store.archive_matches("t", MATCHES[:3])
+    store.archive_matches("t", MATCHES[2:])
+    assert ids(store.get_history("t")) == [3, 2, 1, 0]
+
+    store.delete_history("t")
+    assert store.get_history("t") == []
+
+
+def test_snapshot_and_events(store):
+    store.append_event("t", {"type": "add_player", "name": "alice"})
+    assert store.get("t") is None
+    assert store.get_events("t") == [{"type": "add_player", "name": "alice"}]
+
+    store.put("t", b"snapshot")
+    assert store.get("t") == b"snapshot"
+    assert store.get_events("t") == []